@@ -0,0 +1,142 @@
+"""
+Size and parse time of one incremental sync of a bot in 2000 rooms.
+
+The homeserver side is simulated: each room gets the same burst of chat
+messages, membership changes, receipts and typing notifications, and the
+server is assumed to drop what a filter excludes, including rooms left
+empty. Three setups are compared:
+
+- "unfiltered": no filter, as before the sync was filtered
+- "union": the event types of all listeners applied to every room
+- "scoped": the current filter, plus the /messages requests which fetch
+  the admin and announcement room events of the room scoped listeners
+
+Run from the repository root:
+
+    poetry run python -m benchmarks.sync_filter
+"""
+
+import json
+import timeit
+from nio import RoomMessagesResponse, SyncResponse
+
+ROOMS = 2000
+MESSAGES_PER_ROOM = 5
+MEMBER_CHANGES_PER_ROOM = 1
+SPACE_CHILD_CHANGES = 2
+REPEAT = 5
+
+ADMIN_ROOM = "!admin:bench"
+ANNOUNCEMENT_ROOM = "!announcement:bench"
+UNION_TYPES = {
+    "m.room.member",
+    "m.room.message",
+    "m.space.child",
+    "org.herald.tree_structure_request",
+}
+SCOPED_TYPES = {"m.space.child", "org.herald.tree_structure_request"}
+ROOM_SCOPED_TYPES = {ADMIN_ROOM: "m.room.message", ANNOUNCEMENT_ROOM: "m.room.member"}
+
+def event(room: int, n: int, event_type: str, content: dict, state_key: str | None = None):
+    body = {
+        "type": event_type,
+        "event_id": f"$e{room}_{n}:bench",
+        "sender": f"@user{n}:bench",
+        "origin_server_ts": 1_700_000_000_000 + n,
+        "content": content,
+        "unsigned": {"age": 1000},
+    }
+    if state_key is not None:
+        body["state_key"] = state_key
+    return body
+
+def room_timeline(room: int) -> list[dict]:
+    events = [
+        event(room, n, "m.room.message", {"msgtype": "m.text", "body": f"message {n} " * 8})
+        for n in range(MESSAGES_PER_ROOM)
+    ]
+    events += [
+        event(
+            room,
+            MESSAGES_PER_ROOM + n,
+            "m.room.member",
+            {"membership": "join", "displayname": f"User {n}"},
+            f"@user{n}:bench"
+        )
+        for n in range(MEMBER_CHANGES_PER_ROOM)
+    ]
+    if room >= ROOMS - SPACE_CHILD_CHANGES:
+        events.append(event(room, 99, "m.space.child", {"via": ["bench"]}, f"!new{room}:bench"))
+    return events
+
+def room_ids() -> list[str]:
+    return [ADMIN_ROOM, ANNOUNCEMENT_ROOM] + [f"!r{i}:bench" for i in range(ROOMS - 2)]
+
+def sync_body(types: set[str] | None) -> dict:
+    joined = {}
+    for i, room_id in enumerate(room_ids()):
+        timeline = [e for e in room_timeline(i) if types is None or e["type"] in types]
+        ephemeral = [] if types is not None else [
+            {"type": "m.typing", "content": {"user_ids": ["@user1:bench"]}},
+            {"type": "m.receipt", "content": {
+                timeline[0]["event_id"]: {"m.read": {"@user2:bench": {"ts": 1}}}
+            }},
+        ]
+        if not timeline and not ephemeral:
+            continue
+        joined[room_id] = {
+            "timeline": {"events": timeline, "limited": False, "prev_batch": "p"},
+            "state": {"events": []},
+            "ephemeral": {"events": ephemeral},
+            "account_data": {"events": []},
+            "summary": {"m.joined_member_count": 50},
+            "unread_notifications": {"notification_count": 0, "highlight_count": 0},
+        }
+    body: dict = {"next_batch": "s2", "rooms": {"join": joined, "invite": {}, "leave": {}}}
+    if types is None:
+        body["presence"] = {"events": [
+            {"type": "m.presence", "sender": f"@user{n}:bench",
+             "content": {"presence": "online", "last_active_ago": 10}}
+            for n in range(200)
+        ]}
+    return body
+
+def messages_bodies() -> dict[str, dict]:
+    return {
+        room_id: {
+            "chunk": [e for e in room_timeline(i) if e["type"] == ROOM_SCOPED_TYPES[room_id]],
+            "start": "s1",
+            "end": "s2",
+        }
+        for i, room_id in enumerate(room_ids()[:2])
+    }
+
+def measure(payloads: dict[str, str]) -> float:
+    def parse():
+        for room_id, payload in payloads.items():
+            if room_id:
+                RoomMessagesResponse.from_dict(json.loads(payload), room_id)
+            else:
+                SyncResponse.from_dict(json.loads(payload))
+    return min(timeit.repeat(parse, number=1, repeat=REPEAT))
+
+def main():
+    setups = {
+        "unfiltered": {"": json.dumps(sync_body(None))},
+        "union": {"": json.dumps(sync_body(UNION_TYPES))},
+        "scoped": {
+            "": json.dumps(sync_body(SCOPED_TYPES)),
+            **{room_id: json.dumps(body) for room_id, body in messages_bodies().items()},
+        },
+    }
+
+    print(f"{ROOMS} rooms, {MESSAGES_PER_ROOM} messages and {MEMBER_CHANGES_PER_ROOM} "
+          f"member changes per room, {SPACE_CHILD_CHANGES} space child changes")
+    for name, payloads in setups.items():
+        size = sum(len(payload) for payload in payloads.values())
+        parse = measure(payloads)
+        print(f"{name:10} {size / 1024:9.1f} KiB {parse * 1000:9.2f} ms "
+              f"({len(payloads)} responses)")
+
+if __name__ == "__main__":
+    main()
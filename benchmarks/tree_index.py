@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of MatrixTree lookups and mutations on a 10k-node tree.
+
+The "linear" figures reproduce what MatrixTree did before it kept indexes:
+a full MatrixTreeIterator walk to find the parent, a list membership test
+and a full cache rebuild after every mutation.
+
+Run from the repository root:
+
+    poetry run python -m benchmarks.tree_index
+"""
+
+import random
+import timeit
+from matrix_herald_bot.model.enums import MatrixNodeType
+from matrix_herald_bot.model.tree import MatrixTree
+from matrix_herald_bot.model.tree_node import MatrixTreeNode
+from matrix_herald_bot.util.tree_iterator import MatrixTreeIterator
+
+NODES = 10_000
+FANOUT = 20
+REPEAT = 200
+
+def build_root(nodes: int, fanout: int) -> MatrixTreeNode:
+    root = MatrixTreeNode("!0:bench", "0", None, MatrixNodeType.SPACE)
+    all_nodes = [root]
+    for i in range(1, nodes):
+        node = MatrixTreeNode(f"!{i}:bench", str(i), None, MatrixNodeType.ROOM)
+        all_nodes[(i - 1) // fanout].childs.append(node)
+        all_nodes.append(node)
+    return root
+
+def linear_child_ids(root: MatrixTreeNode) -> list[str]:
+    return [node.id for node in MatrixTreeIterator(root)]
+
+def linear_add(root: MatrixTreeNode, parent_id: str, node: MatrixTreeNode):
+    for tree_node in MatrixTreeIterator(root):
+        if tree_node.id == parent_id:
+            tree_node.childs.append(node)
+            linear_child_ids(root)  # the old cache rebuild on next access
+            return
+
+def linear_remove(root: MatrixTreeNode, parent_id: str, removed_id: str):
+    for tree_node in MatrixTreeIterator(root):
+        if tree_node.id == parent_id:
+            tree_node.childs = [c for c in tree_node.childs if c.id != removed_id]
+            linear_child_ids(root)
+            return
+
+def main():
+    random.seed(0)
+    parents = [f"!{random.randrange(NODES)}:bench" for _ in range(REPEAT)]
+
+    linear_root = build_root(NODES, FANOUT)
+    linear_ids = linear_child_ids(linear_root)
+    tree = MatrixTree(build_root(NODES, FANOUT))
+
+    def run_linear():
+        for i, parent_id in enumerate(parents):
+            assert parent_id in linear_ids
+            new_id = f"!new{i}:bench"
+            linear_add(
+                linear_root,
+                parent_id,
+                MatrixTreeNode(new_id, None, None, MatrixNodeType.ROOM)
+            )
+            linear_remove(linear_root, parent_id, new_id)
+
+    def run_indexed():
+        for i, parent_id in enumerate(parents):
+            assert parent_id in tree
+            new_id = f"!new{i}:bench"
+            tree.add_node(parent_id, MatrixTreeNode(new_id, None, None, MatrixNodeType.ROOM))
+            tree.remove_node(parent_id, new_id)
+
+    linear = min(timeit.repeat(run_linear, number=1, repeat=3))
+    indexed = min(timeit.repeat(run_indexed, number=1, repeat=3))
+
+    print(f"{NODES} nodes, {REPEAT} x (membership test + add + remove)")
+    print(f"linear:  {linear * 1000:9.2f} ms")
+    print(f"indexed: {indexed * 1000:9.2f} ms ({linear / indexed:.0f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 import os
 from dotenv import load_dotenv
 
-from matrix_herald_bot.config.model import Configuration, ConfigurationError
+from matrix_herald_bot.config.model import (
+    CRAWL_BACKENDS,
+    DEFAULT_REQUEST_ENDPOINT_CONCURRENCY,
+    DEFAULT_REQUEST_LANE_MAX_QUEUE,
+    DEFAULT_REQUEST_LANE_WEIGHTS,
+    Configuration,
+    ConfigurationError
+)
 
 def getenv_or_raise(varname: str) -> str:
     value = os.getenv(varname)
@@ -9,6 +16,86 @@ def getenv_or_raise(varname: str) -> str:
         raise ConfigurationError(f"Environment variable '{varname}' is missing or empty.")
     return value
 
+def getenv_int(varname: str, default: int, minimum: int = 0) -> int:
+    value = os.getenv(varname)
+    if not value or not value.strip():
+        return default
+    try:
+        parsed = int(value)
+    except ValueError as e:
+        raise ConfigurationError(
+            f"Environment variable '{varname}' must be an integer, got '{value}'."
+        ) from e
+    if parsed < minimum:
+        raise ConfigurationError(
+            f"Environment variable '{varname}' must be at least {minimum}, got {parsed}."
+        )
+    return parsed
+
+def getenv_float(varname: str, default: float, minimum: float = 0) -> float:
+    value = os.getenv(varname)
+    if not value or not value.strip():
+        return default
+    try:
+        parsed = float(value)
+    except ValueError as e:
+        raise ConfigurationError(
+            f"Environment variable '{varname}' must be a number, got '{value}'."
+        ) from e
+    if parsed < minimum:
+        raise ConfigurationError(
+            f"Environment variable '{varname}' must be at least {minimum}, got {parsed}."
+        )
+    return parsed
+
+def getenv_limits(
+    varname: str,
+    default: dict[str, int],
+    minimum: int = 1,
+    names: tuple[str, ...] | None = None
+) -> dict[str, int]:
+    """
+    Parse 'name=limit,name=limit' into a dict, entries override the defaults.
+    If names is given, only those names are accepted.
+    """
+    value = os.getenv(varname)
+    limits = dict(default)
+    if not value or not value.strip():
+        return limits
+    for entry in value.split(","):
+        name, _, limit = entry.partition("=")
+        try:
+            parsed = int(limit)
+        except ValueError as e:
+            raise ConfigurationError(
+                f"Environment variable '{varname}' must look like 'name=limit,...', "
+                f"got '{entry}'."
+            ) from e
+        if parsed < minimum:
+            raise ConfigurationError(
+                f"Environment variable '{varname}': limit of '{name.strip()}' "
+                f"must be at least {minimum}."
+            )
+        if names is not None and name.strip() not in names:
+            raise ConfigurationError(
+                f"Environment variable '{varname}': '{name.strip()}' must be one of "
+                f"{', '.join(names)}."
+            )
+        limits[name.strip()] = parsed
+    return limits
+
+def getenv_choice(varname: str, choices: tuple[str, ...], default: str) -> str:
+    value = os.getenv(varname)
+    if not value or not value.strip():
+        return default
+    value = value.strip().lower()
+    if value not in choices:
+        raise ConfigurationError(
+            f"Environment variable '{varname}' must be one of {', '.join(choices)}, "
+            f"got '{value}'."
+        )
+    return value
+
 def build_configuration_from_env() -> Configuration:
     load_dotenv()
     config = Configuration(
@@ -19,5 +106,54 @@ def build_configuration_from_env() -> Configuration:
         getenv_or_raise("WATCHED_SPACE"),
         getenv_or_raise("ADMIN_ROOM_ID"),
         getenv_or_raise("ENVIRONMENT"),
+        crawl_concurrency=getenv_int("CRAWL_CONCURRENCY", 16, minimum=1),
+        crawl_backend=getenv_choice("CRAWL_BACKEND", CRAWL_BACKENDS, "state"),
+        data_dir=os.path.abspath(os.path.expanduser(os.getenv("DATA_DIR") or "./data")),
+        event_coalesce_quiet_ms=getenv_int("EVENT_COALESCE_QUIET_MS", 500),
+        event_coalesce_max_delay_ms=getenv_int("EVENT_COALESCE_MAX_DELAY_MS", 5000),
+        tree_max_staleness_s=getenv_int("TREE_MAX_STALENESS_S", 300),
+        request_rate=getenv_float("REQUEST_RATE", 20.0),
+        request_burst=getenv_int("REQUEST_BURST", 40, minimum=1),
+        request_concurrency=getenv_int("REQUEST_CONCURRENCY", 32, minimum=1),
+        request_endpoint_concurrency=getenv_limits(
+            "REQUEST_ENDPOINT_CONCURRENCY",
+            DEFAULT_REQUEST_ENDPOINT_CONCURRENCY
+        ),
+        request_max_retries=getenv_int("REQUEST_MAX_RETRIES", 5),
+        request_lane_weights=getenv_limits(
+            "REQUEST_LANE_WEIGHTS",
+            DEFAULT_REQUEST_LANE_WEIGHTS,
+            names=tuple(DEFAULT_REQUEST_LANE_WEIGHTS)
+        ),
+        request_lane_max_queue=getenv_limits(
+            "REQUEST_LANE_MAX_QUEUE",
+            DEFAULT_REQUEST_LANE_MAX_QUEUE,
+            minimum=0,
+            names=tuple(DEFAULT_REQUEST_LANE_MAX_QUEUE)
+        ),
+        admin_command_concurrency=getenv_int("ADMIN_COMMAND_CONCURRENCY", 4, minimum=1),
+        admin_command_timeout_s=getenv_float("ADMIN_COMMAND_TIMEOUT_S", 30.0, minimum=1.0),
+        promotion_power_level=getenv_int("PROMOTION_POWER_LEVEL", 100),
+        job_workers=getenv_int("JOB_WORKERS", 8, minimum=1),
+        job_max_attempts=getenv_int("JOB_MAX_ATTEMPTS", 3, minimum=1),
+        job_progress_interval_s=getenv_float("JOB_PROGRESS_INTERVAL_S", 10.0, minimum=1.0),
+        job_retention_s=getenv_float("JOB_RETENTION_S", 7 * 24 * 3600),
+        promotion_workers=getenv_int("PROMOTION_WORKERS", 4, minimum=1),
+        negative_cache_backoff_s=getenv_float("NEGATIVE_CACHE_BACKOFF_S", 300.0),
+        negative_cache_max_backoff_s=getenv_float("NEGATIVE_CACHE_MAX_BACKOFF_S", 24 * 3600),
+        negative_cache_ttl_s=getenv_float("NEGATIVE_CACHE_TTL_S", 7 * 24 * 3600),
+        event_workers=getenv_int("EVENT_WORKERS", 4, minimum=1),
+        event_listener_timeout_s=getenv_float("EVENT_LISTENER_TIMEOUT_S", 600.0),
+        metrics_port=getenv_int("METRICS_PORT", 0),
+        metrics_host=os.getenv("METRICS_HOST") or "127.0.0.1",
+        event_lag_slo_s=getenv_float("EVENT_LAG_SLO_S", 120.0),
+        event_lag_window_s=getenv_float("EVENT_LAG_WINDOW_S", 3600.0, minimum=1.0),
+        event_lag_alert_interval_s=getenv_float("EVENT_LAG_ALERT_INTERVAL_S", 1800.0),
+        state_targeted_fetch_min_members=getenv_int(
+            "STATE_TARGETED_FETCH_MIN_MEMBERS",
+            500,
+            minimum=1
+        ),
+        admin_bot_id=os.getenv("ADMIN_BOT_ID") or None,
     )
     return config
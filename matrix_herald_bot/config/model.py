@@ -1,6 +1,28 @@
 class ConfigurationError(Exception):
     pass
 
+CRAWL_BACKENDS = ("state", "hierarchy", "sync")
+
+# concurrency caps per request endpoint (nio method name)
+DEFAULT_REQUEST_ENDPOINT_CONCURRENCY = {
+    "room_send": 8,
+    "join": 8,
+}
+
+# share of the request slots each priority class gets while others wait
+DEFAULT_REQUEST_LANE_WEIGHTS = {
+    "interactive": 8,
+    "tree_maintenance": 3,
+    "bulk_admin": 1,
+}
+
+# waiting requests per priority class before new ones are shed, 0 = unbounded
+DEFAULT_REQUEST_LANE_MAX_QUEUE = {
+    "interactive": 100,
+    "tree_maintenance": 0,
+    "bulk_admin": 0,
+}
+
 class Configuration:
     def __init__(
         self,
@@ -10,7 +32,40 @@ class Configuration:
         announcement_room: str,
         watched_space: str,
         admin_room_id: str,
-        env: str
+        env: str,
+        crawl_concurrency: int = 16,
+        crawl_backend: str = "state",
+        data_dir: str = "./data",
+        event_coalesce_quiet_ms: int = 500,
+        event_coalesce_max_delay_ms: int = 5000,
+        tree_max_staleness_s: int = 300,
+        request_rate: float = 20.0,
+        request_burst: int = 40,
+        request_concurrency: int = 32,
+        request_endpoint_concurrency: dict[str, int] | None = None,
+        request_max_retries: int = 5,
+        request_lane_weights: dict[str, int] | None = None,
+        request_lane_max_queue: dict[str, int] | None = None,
+        admin_command_concurrency: int = 4,
+        admin_command_timeout_s: float = 30.0,
+        promotion_power_level: int = 100,
+        job_workers: int = 8,
+        job_max_attempts: int = 3,
+        job_progress_interval_s: float = 10.0,
+        job_retention_s: float = 7 * 24 * 3600,
+        promotion_workers: int = 4,
+        negative_cache_backoff_s: float = 300.0,
+        negative_cache_max_backoff_s: float = 24 * 3600,
+        negative_cache_ttl_s: float = 7 * 24 * 3600,
+        event_workers: int = 4,
+        event_listener_timeout_s: float = 600.0,
+        metrics_port: int = 0,
+        metrics_host: str = "127.0.0.1",
+        event_lag_slo_s: float = 120.0,
+        event_lag_window_s: float = 3600.0,
+        event_lag_alert_interval_s: float = 1800.0,
+        state_targeted_fetch_min_members: int = 500,
+        admin_bot_id: str | None = None
     ):
         self.homeserver = homeserver
         self.server_admin_id = server_admin_id
@@ -19,3 +74,50 @@ class Configuration:
         self.watched_space = watched_space
         self.admin_room_id = admin_room_id
         self.env = env
+        self.crawl_concurrency = crawl_concurrency
+        self.crawl_backend = crawl_backend
+        self.data_dir = data_dir
+        self.event_coalesce_quiet_ms = event_coalesce_quiet_ms
+        self.event_coalesce_max_delay_ms = event_coalesce_max_delay_ms
+        self.tree_max_staleness_s = tree_max_staleness_s
+        self.request_rate = request_rate
+        self.request_burst = request_burst
+        self.request_concurrency = request_concurrency
+        self.request_endpoint_concurrency = (
+            DEFAULT_REQUEST_ENDPOINT_CONCURRENCY
+            if request_endpoint_concurrency is None
+            else request_endpoint_concurrency
+        )
+        self.request_max_retries = request_max_retries
+        self.request_lane_weights = (
+            DEFAULT_REQUEST_LANE_WEIGHTS
+            if request_lane_weights is None
+            else request_lane_weights
+        )
+        self.request_lane_max_queue = (
+            DEFAULT_REQUEST_LANE_MAX_QUEUE
+            if request_lane_max_queue is None
+            else request_lane_max_queue
+        )
+        self.admin_command_concurrency = admin_command_concurrency
+        self.admin_command_timeout_s = admin_command_timeout_s
+        self.promotion_power_level = promotion_power_level
+        self.job_workers = job_workers
+        self.job_max_attempts = job_max_attempts
+        self.job_progress_interval_s = job_progress_interval_s
+        self.job_retention_s = job_retention_s
+        self.promotion_workers = promotion_workers
+        self.negative_cache_backoff_s = negative_cache_backoff_s
+        self.negative_cache_max_backoff_s = negative_cache_max_backoff_s
+        self.negative_cache_ttl_s = negative_cache_ttl_s
+        self.event_workers = event_workers
+        self.event_listener_timeout_s = event_listener_timeout_s
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.event_lag_slo_s = event_lag_slo_s
+        self.event_lag_window_s = event_lag_window_s
+        self.event_lag_alert_interval_s = event_lag_alert_interval_s
+        self.state_targeted_fetch_min_members = state_targeted_fetch_min_members
+        self.admin_bot_id = (
+            admin_bot_id or f"@conduit:{server_admin_id.partition(':')[2]}"
+        )
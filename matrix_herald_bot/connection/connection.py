@@ -1,8 +1,37 @@
+import time
 from injector import inject, singleton
-from nio import AsyncClient
+from nio import AsyncClient, AsyncClientConfig, SyncResponse
 from matrix_herald_bot.config.model import Configuration
 from matrix_herald_bot.model.exceptions import NotConnectedError
 
+class HeraldAsyncClient(AsyncClient):
+    """AsyncClient which measures the size and parse time of sync responses."""
+
+    last_sync_payload_bytes: int = 0
+    last_sync_parse_s: float = 0.0
+
+    async def create_matrix_response(
+        self,
+        response_class,
+        transport_response,
+        data=None,
+        save_to=None
+    ):
+        if response_class is not SyncResponse:
+            return await super().create_matrix_response(
+                response_class, transport_response, data, save_to
+            )
+        # reading first keeps the download out of the parse time, aiohttp
+        # hands the buffered body to the parser afterwards
+        body = await transport_response.read()
+        started = time.perf_counter()
+        response = await super().create_matrix_response(
+            response_class, transport_response, data, save_to
+        )
+        self.last_sync_payload_bytes = len(body)
+        self.last_sync_parse_s = time.perf_counter() - started
+        return response
+
 @singleton
 class Connection:
     @inject
@@ -13,7 +42,14 @@ class Connection:
 
     async def connect(self):
         if not self.connected:
-            client = AsyncClient(self.config.homeserver, self.config.server_admin_id)
+            client = HeraldAsyncClient(
+                self.config.homeserver,
+                self.config.server_admin_id,
+                # rate limits are handled by MatrixRequestScheduler, which
+                # pauses all requests instead of just the limited one, and by
+                # the sync loop of HeraldBotEventLoop
+                config=AsyncClientConfig(max_limit_exceeded=0)
+            )
             client.access_token = self.config.server_admin_token
             client.user_id = self.config.server_admin_id
             self.client = client
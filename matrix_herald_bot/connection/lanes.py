@@ -0,0 +1,111 @@
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from matrix_herald_bot.model.enums import RequestPriority
+from matrix_herald_bot.model.exceptions import RequestShedError
+
+@dataclass
+class LaneStats:
+    in_flight: int = 0
+    served: int = 0
+    shed: int = 0
+    wait_total_s: float = 0.0
+    wait_max_s: float = 0.0
+
+class PriorityLanes:
+    """
+    Hands out a fixed number of request slots to priority classes.
+
+    As long as slots are free every request gets one right away. Once
+    requests have to wait, the free slots are shared by the waiting classes
+    in proportion to their weights (stride scheduling), so bulk work keeps
+    moving but can not hold up interactive requests. A class whose queue is
+    full sheds new requests with RequestShedError.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        weights: dict[RequestPriority, int],
+        max_queue: dict[RequestPriority, int]
+    ):
+        self._free = slots
+        self._weights = {p: max(1, weights.get(p, 1)) for p in RequestPriority}
+        self._max_queue = max_queue
+        self._queues: dict[RequestPriority, deque[asyncio.Future[None]]] = {
+            p: deque() for p in RequestPriority
+        }
+        self._pass = {p: 0.0 for p in RequestPriority}
+        self._virtual_time = 0.0
+        self.stats = {p: LaneStats() for p in RequestPriority}
+
+    @asynccontextmanager
+    async def slot(self, priority: RequestPriority) -> AsyncIterator[None]:
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def queue_depth(self, priority: RequestPriority) -> int:
+        return len(self._queues[priority])
+
+    async def _acquire(self, priority: RequestPriority):
+        if self._free > 0 and not any(self._queues.values()):
+            self._take(priority)
+            self._record_wait(priority, 0.0)
+            return
+
+        queue = self._queues[priority]
+        limit = self._max_queue.get(priority, 0)
+        if limit and len(queue) >= limit:
+            self.stats[priority].shed += 1
+            raise RequestShedError(priority.value, len(queue))
+
+        if not queue:
+            # a class becoming active must not cash in on the time it was idle
+            self._pass[priority] = max(self._pass[priority], self._virtual_time)
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        queue.append(waiter)
+        started = loop.time()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted while we got cancelled, pass it on
+                self._release(priority)
+            else:
+                queue.remove(waiter)
+            raise
+        self._record_wait(priority, loop.time() - started)
+
+    def _take(self, priority: RequestPriority):
+        self._free -= 1
+        self._virtual_time = self._pass[priority]
+        self._pass[priority] += 1 / self._weights[priority]
+        self.stats[priority].in_flight += 1
+
+    def _release(self, priority: RequestPriority):
+        self.stats[priority].in_flight -= 1
+        self._free += 1
+        self._grant()
+
+    def _grant(self):
+        while self._free > 0:
+            waiting = [p for p in RequestPriority if self._queues[p]]
+            if not waiting:
+                return
+            priority = min(waiting, key=lambda p: self._pass[p])
+            waiter = self._queues[priority].popleft()
+            self._take(priority)
+            waiter.set_result(None)
+
+    def _record_wait(self, priority: RequestPriority, waited: float):
+        stats = self.stats[priority]
+        stats.served += 1
+        stats.wait_total_s += waited
+        stats.wait_max_s = max(stats.wait_max_s, waited)
@@ -0,0 +1,243 @@
+import asyncio
+from collections import Counter
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from injector import inject, singleton
+from nio import AsyncClient, ErrorResponse
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.lanes import PriorityLanes
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
+from matrix_herald_bot.model.enums import RequestPriority
+
+# used when the server rate limits without telling how long to wait
+DEFAULT_RETRY_AFTER_MS = 5000
+
+_request_priority: ContextVar[RequestPriority] = ContextVar(
+    "request_priority",
+    default=RequestPriority.TREE_MAINTENANCE
+)
+
+@contextmanager
+def request_priority(priority: RequestPriority) -> Iterator[None]:
+    """
+    Set the priority of the requests made in this context, including tasks
+    created in it. Requests default to TREE_MAINTENANCE.
+    """
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+class _TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = 0.0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated_at:
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated_at) * self.rate
+                )
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class _NoLimit:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+_NO_LIMIT = _NoLimit()
+
+@singleton
+class MatrixRequestScheduler:
+    """
+    Every outbound homeserver request goes through here.
+
+    Requests are limited by a token bucket, a global concurrency cap shared
+    by the priority classes (see PriorityLanes) and per-endpoint caps. An
+    M_LIMIT_EXCEEDED answer pauses all requests for the retry_after_ms the
+    server asked for, after which the request is retried.
+    """
+
+    @inject
+    def __init__(
+        self,
+        connection: Connection,
+        config: Configuration,
+        logger: MatrixLogger,
+        metrics: MetricsRegistry
+    ):
+        self.connection = connection
+        self.config = config
+        self.logger = logger
+        self._bucket = _TokenBucket(config.request_rate, config.request_burst)
+        self._lanes = PriorityLanes(
+            config.request_concurrency,
+            {RequestPriority(p): w for p, w in config.request_lane_weights.items()},
+            {RequestPriority(p): q for p, q in config.request_lane_max_queue.items()}
+        )
+        self._endpoint_concurrency = {
+            endpoint: asyncio.Semaphore(limit)
+            for endpoint, limit in config.request_endpoint_concurrency.items()
+        }
+        self._paused_until = 0.0
+        # requests / rate_limited / gave_up per endpoint since start
+        self.stats: dict[str, Counter[str]] = {}
+        self._request_count = metrics.counter(
+            "herald_homeserver_requests_total",
+            "Homeserver requests by endpoint and outcome (ok, error, rate_limited).",
+            ("endpoint", "outcome")
+        )
+        self._request_duration = metrics.histogram(
+            "herald_homeserver_request_duration_seconds",
+            "Homeserver request latency by endpoint, without the time spent waiting for a slot.",
+            ("endpoint",)
+        )
+        self._lane_gauges = {
+            "queued": metrics.gauge(
+                "herald_request_lane_queued",
+                "Requests waiting for a slot per priority class.",
+                ("priority",)
+            ),
+            "in_flight": metrics.gauge(
+                "herald_request_lane_in_flight",
+                "Requests in flight per priority class.",
+                ("priority",)
+            ),
+            "wait_avg_s": metrics.gauge(
+                "herald_request_lane_wait_avg_seconds",
+                "Average time requests waited for a slot per priority class since start.",
+                ("priority",)
+            ),
+            "wait_max_s": metrics.gauge(
+                "herald_request_lane_wait_max_seconds",
+                "Longest time a request waited for a slot per priority class since start.",
+                ("priority",)
+            ),
+        }
+        self._lane_counters = {
+            "served": metrics.counter(
+                "herald_request_lane_served_total",
+                "Requests which got a slot per priority class.",
+                ("priority",)
+            ),
+            "shed": metrics.counter(
+                "herald_request_lane_shed_total",
+                "Requests shed because the queue of their priority class was full.",
+                ("priority",)
+            ),
+        }
+        metrics.add_collector(self._collect_metrics)
+
+    async def request[R](
+        self,
+        endpoint: str,
+        call: Callable[[AsyncClient], Awaitable[R]],
+        priority: RequestPriority | None = None
+    ) -> R:
+        """
+        Run call with the client once the limits allow it.
+
+        endpoint names the request for the per-endpoint caps and statistics,
+        by convention the nio method name (e.g. "room_get_state"). Without an
+        explicit priority the one set by request_priority() is used.
+
+        Raises RequestShedError if the queue of the priority class is full.
+        """
+        client = self.connection.get_client_or_raise()
+        priority = priority or _request_priority.get()
+        stats = self.stats.setdefault(endpoint, Counter())
+        loop = asyncio.get_running_loop()
+        attempt = 0
+
+        while True:
+            async with self._endpoint_slot(endpoint), self._lanes.slot(priority):
+                await self._wait_for_pause()
+                await self._bucket.acquire()
+                stats["requests"] += 1
+                started = loop.time()
+                response = await call(client)
+                self._request_duration.observe(loop.time() - started, endpoint=endpoint)
+
+            if not self._is_rate_limited(response):
+                self._request_count.inc(
+                    endpoint=endpoint,
+                    outcome="error" if isinstance(response, ErrorResponse) else "ok"
+                )
+                return response
+
+            stats["rate_limited"] += 1
+            self._request_count.inc(endpoint=endpoint, outcome="rate_limited")
+            if attempt >= self.config.request_max_retries:
+                stats["gave_up"] += 1
+                self.logger.error(
+                    f"Giving up on rate limited {endpoint} request after {attempt} retries."
+                )
+                return response
+
+            attempt += 1
+            retry_after_ms = getattr(response, "retry_after_ms", None) or DEFAULT_RETRY_AFTER_MS
+            self._pause(retry_after_ms / 1000)
+            self.logger.warning(
+                f"Rate limited on {endpoint}, pausing requests for {retry_after_ms} ms "
+                f"(retry {attempt}/{self.config.request_max_retries})."
+            )
+
+    def lane_stats(self) -> dict[str, dict[str, float]]:
+        """Queue depth, in-flight requests and wait times per priority class."""
+        return {
+            priority.value: {
+                "queued": self._lanes.queue_depth(priority),
+                "in_flight": stats.in_flight,
+                "served": stats.served,
+                "shed": stats.shed,
+                "wait_avg_s": stats.wait_total_s / stats.served if stats.served else 0.0,
+                "wait_max_s": stats.wait_max_s,
+            }
+            for priority, stats in self._lanes.stats.items()
+        }
+
+    def _collect_metrics(self):
+        for priority, stats in self.lane_stats().items():
+            for name, value in stats.items():
+                if (counter := self._lane_counters.get(name)) is not None:
+                    # the lanes count since start, the counter only learns the increase
+                    counter.inc(value - counter.values.get((priority,), 0), priority=priority)
+                else:
+                    self._lane_gauges[name].set(value, priority=priority)
+
+    def _endpoint_slot(self, endpoint: str) -> asyncio.Semaphore | _NoLimit:
+        return self._endpoint_concurrency.get(endpoint) or _NO_LIMIT
+
+    def _pause(self, seconds: float):
+        until = asyncio.get_running_loop().time() + seconds
+        self._paused_until = max(self._paused_until, until)
+
+    async def _wait_for_pause(self):
+        loop = asyncio.get_running_loop()
+        while (delay := self._paused_until - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _is_rate_limited(response: object) -> bool:
+        return (
+            isinstance(response, ErrorResponse)
+            and response.status_code in {"M_LIMIT_EXCEEDED", 429, "429"}
+        )
@@ -1,18 +1,172 @@
 import asyncio
+from dataclasses import dataclass
 from typing import Any
 from injector import inject, singleton
 
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.core.event.events import CoalescableEvent
 from matrix_herald_bot.core.event.listener_interface import CoreListenerInterface
+from matrix_herald_bot.core.logging.loggers import CoreLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
+
+@dataclass
+class _PendingEvent:
+    event: CoalescableEvent
+    flush_at: float
+    deadline: float
+    merged: int = 1
+
+@dataclass
+class ListenerStats:
+    calls: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    latency_total_s: float = 0.0
+    latency_max_s: float = 0.0
 
 @singleton
 class EventBus:
+    """
+    Dispatches events to the listeners registered for their type or one of
+    its base classes. The listeners of an event run concurrently, each with
+    its own timeout; a failing listener does not affect the others.
+    """
+
     @inject
-    def __init__(self, listeners: list[CoreListenerInterface]):
+    def __init__(
+        self,
+        listeners: list[CoreListenerInterface],
+        config: Configuration,
+        logger: CoreLogger,
+        metrics: MetricsRegistry
+    ):
         self.listeners = listeners
+        self.config = config
+        self.logger = logger
+        self._listener_duration = metrics.histogram(
+            "herald_event_listener_duration_seconds",
+            "Time an internal event listener took to handle an event.",
+            ("listener",)
+        )
+        self._listener_errors = metrics.counter(
+            "herald_event_listener_errors_total",
+            "Internal event listener runs which failed or timed out.",
+            ("listener", "reason")
+        )
+        self.listener_stats: dict[str, ListenerStats] = {
+            type(listener).__name__: ListenerStats() for listener in listeners
+        }
+        self._by_type: dict[type, list[CoreListenerInterface]] = {}
+        for listener in listeners:
+            self._by_type.setdefault(listener.getEventType(), []).append(listener)
+        # concrete event type -> listeners of it and its base classes
+        self._dispatch_table: dict[type, tuple[CoreListenerInterface, ...]] = {}
+        self._pending: dict[tuple[type, str], _PendingEvent] = {}
+        self._background_tasks: set[asyncio.Task] = set()
+
+    async def publish(self, event: Any, wait: bool = True):
+        """
+        Dispatch the event to its listeners, without waiting for them unless
+        wait is set.
+
+        Coalescable events are held back until no event with the same key
+        arrived for the quiet window (at most for the maximum delay) and are
+        then dispatched once in the background.
+        """
+        if isinstance(event, CoalescableEvent) and self.config.event_coalesce_quiet_ms > 0:
+            self._coalesce(event)
+        elif wait:
+            await self._dispatch(event)
+        else:
+            self._run_in_background(self._dispatch(event))
+
+    async def flush(self):
+        """Dispatch all held back events now."""
+        pending, self._pending = self._pending, {}
+        await asyncio.gather(*(self._dispatch(entry.event) for entry in pending.values()))
+
+    def listeners_of(self, event_type: type) -> tuple[CoreListenerInterface, ...]:
+        listeners = self._dispatch_table.get(event_type)
+        if listeners is None:
+            listeners = tuple(
+                listener
+                for cls in event_type.__mro__
+                for listener in self._by_type.get(cls, ())
+            )
+            self._dispatch_table[event_type] = listeners
+        return listeners
 
-    async def publish(self, event: Any):
-        for listener in self.listeners:
-            if isinstance(event, listener.getEventType()):
+    async def _dispatch(self, event: Any):
+        listeners = self.listeners_of(type(event))
+        if len(listeners) == 1:
+            await self._call(listeners[0], event)
+        elif listeners:
+            await asyncio.gather(*(self._call(listener, event) for listener in listeners))
+
+    async def _call(self, listener: CoreListenerInterface, event: Any):
+        name = type(listener).__name__
+        stats = self.listener_stats[name]
+        timeout = self.config.event_listener_timeout_s or None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            async with asyncio.timeout(timeout):
                 result = listener.onEvent(event)
                 if asyncio.iscoroutine(result):
                     await result
+        except TimeoutError:
+            stats.timed_out += 1
+            self._listener_errors.inc(listener=name, reason="timeout")
+            self.logger.warning(
+                f"{name} did not handle {type(event).__name__} within {timeout}s."
+            )
+        except Exception: # pylint: disable=broad-exception-caught
+            stats.failed += 1
+            self._listener_errors.inc(listener=name, reason="exception")
+            self.logger.exception(f"{name} failed to handle {type(event).__name__}.")
+        finally:
+            latency = loop.time() - started
+            stats.calls += 1
+            stats.latency_total_s += latency
+            stats.latency_max_s = max(stats.latency_max_s, latency)
+            self._listener_duration.observe(latency, listener=name)
+            self.logger.debug(
+                f"{name} handled {type(event).__name__}.",
+                extra={"latency_ms": round(latency * 1000, 2)}
+            )
+
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _coalesce(self, event: CoalescableEvent):
+        now = asyncio.get_running_loop().time()
+        quiet = self.config.event_coalesce_quiet_ms / 1000
+        key = (type(event), event.coalesce_key())
+
+        pending = self._pending.get(key)
+        if pending is None:
+            max_delay = self.config.event_coalesce_max_delay_ms / 1000
+            pending = _PendingEvent(event, now + quiet, now + max(quiet, max_delay))
+            self._pending[key] = pending
+            self._run_in_background(self._flush_when_quiet(key, pending))
+        else:
+            pending.event = pending.event.merge(event)
+            pending.merged += 1
+            pending.flush_at = min(now + quiet, pending.deadline)
+
+    async def _flush_when_quiet(self, key: tuple[type, str], pending: _PendingEvent):
+        loop = asyncio.get_running_loop()
+        while (delay := pending.flush_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+        if self._pending.get(key) is not pending:
+            return # already dispatched by flush()
+        del self._pending[key]
+
+        self.logger.debug(
+            f"Dispatching {key[0].__name__} for {key[1]}.",
+            extra={"merged_events": pending.merged}
+        )
+        await self._dispatch(pending.event)
@@ -1,6 +1,31 @@
 from dataclasses import dataclass
+from typing import Self, cast
 from matrix_herald_bot.model.tree import MatrixTree
 
+class CoalescableEvent:
+    """
+    Events of the same type and key which are published in a burst are merged
+    by the EventBus and dispatched once.
+    """
+
+    def coalesce_key(self) -> str:
+        raise NotImplementedError
+
+    def merge(self, newer: Self) -> Self:
+        """Combine this pending event with a newer one, by default the newer wins."""
+        return newer
+
 @dataclass
-class TreeStructureUpdated:
+class TreeStructureUpdated(CoalescableEvent):
     tree: MatrixTree
+    # of the oldest Matrix event (ms) which caused the update, if any
+    origin_server_ts: int | None = None
+
+    def coalesce_key(self) -> str:
+        return self.tree.root.id
+
+    def merge(self, newer: CoalescableEvent) -> Self:
+        # the EventBus only merges events of the same type
+        newer = cast(Self, newer)
+        origins = [ts for ts in (self.origin_server_ts, newer.origin_server_ts) if ts is not None]
+        return type(self)(newer.tree, min(origins, default=None))
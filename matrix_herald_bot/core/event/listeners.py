@@ -1,77 +1,113 @@
 import sys
 import inspect
-import asyncio
 from injector import Injector, Module, inject, multiprovider, singleton
-from nio import RoomPutStateError, RoomPutStateResponse, RoomSendError, RoomSendResponse
 from matrix_herald_bot.core.event.events import TreeStructureUpdated
 from matrix_herald_bot.core.event.listener_interface import CoreListenerInterface
-from matrix_herald_bot.core.logging.loggers import MatrixLogger
-from matrix_herald_bot.services.action_service import MatrixActionService
-from matrix_herald_bot.services.admin_service import TuwunelAdminService
+from matrix_herald_bot.core.logging.loggers import CoreLogger, MatrixLogger
+from matrix_herald_bot.services.announcement_members import AnnouncementRoomMembers
+from matrix_herald_bot.services.event_lag import MatrixEventLagTracker
+from matrix_herald_bot.services.job_queue import MatrixJobQueue, promote_job
+from matrix_herald_bot.services.promotion_planner import MatrixPromotionPlanner
+from matrix_herald_bot.services.tree_cache import MatrixTreeCache
 from matrix_herald_bot.services.tree_operations import MatrixTreeOperations
 
 @singleton
 class UpdateHeraldWidgetsOnTreeStructureUpdate(CoreListenerInterface[TreeStructureUpdated]):
     @inject
-    def __init__(self, tree_operations: MatrixTreeOperations):
+    def __init__(
+        self,
+        tree_operations: MatrixTreeOperations,
+        lag_tracker: MatrixEventLagTracker,
+        logger: MatrixLogger
+    ):
         self.tree_operations = tree_operations
+        self.lag_tracker = lag_tracker
+        self.logger = logger
 
     def getEventType(self) -> type[TreeStructureUpdated]:
         return TreeStructureUpdated
 
-    async def onEvent(
-        self,
-        event: TreeStructureUpdated
-    ) -> list[RoomPutStateResponse|RoomPutStateError]:
-        tasks = [
-            self.tree_operations.send_tree_to_room(event.tree, widget.room_id)
-            for widget in event.tree.herald_widgets
-        ]
-        return await asyncio.gather(*tasks)
+    async def onEvent(self, event: TreeStructureUpdated) -> int:
+        if event.origin_server_ts is not None:
+            self.lag_tracker.await_widget_pushes(
+                event.origin_server_ts,
+                [widget.room_id for widget in event.tree.herald_widgets]
+            )
+        queued = await self.tree_operations.queue_widget_pushes(event.tree)
+        self.logger.info(
+            "Queued herald widget updates.",
+            extra={
+                "widgets": len(event.tree.herald_widgets),
+                "queued": queued,
+                "totals": dict(self.tree_operations.widget_push_stats),
+            }
+        )
+        return queued
 
 @singleton
 class PromoteUsersOnTreeStructureUpdate(CoreListenerInterface[TreeStructureUpdated]):
     @inject
     def __init__(
         self,
-        admin_service: TuwunelAdminService,
-        action_service: MatrixActionService,
+        job_queue: MatrixJobQueue,
+        announcement_members: AnnouncementRoomMembers,
+        promotion_planner: MatrixPromotionPlanner,
+        tree_cache: MatrixTreeCache,
         logger: MatrixLogger
     ):
-        self.admin_service = admin_service
-        self.action_service = action_service
+        self.job_queue = job_queue
+        self.announcement_members = announcement_members
+        self.promotion_planner = promotion_planner
+        self.tree_cache = tree_cache
         self.logger = logger
 
     def getEventType(self) -> type[TreeStructureUpdated]:
         return TreeStructureUpdated
 
     async def onEvent(self, event: TreeStructureUpdated):
-        users = await self.action_service.get_users_in_announcement_room_or_raise()
-        rooms = event.tree.childs_which_need_user_promotion
+        tree = event.tree
+        async with self.tree_cache.lock(tree.root.id):
+            rooms = list(tree.childs_which_need_user_promotion)
+        users = await self.announcement_members.get_or_raise()
         self.logger.info(
             "Promoting users from announcement room in new rooms in watched space.",
             extra={
                 "users": users,
                 "rooms": rooms,
             })
-        resp = await self.admin_service.force_promote_users_in_rooms(users, rooms)
-        event.tree.childs_which_need_user_promotion = []
-        await self._log_errors(resp)
+        nodes = [node for room_id in rooms if (node := tree.get_node(room_id))]
+        pairs = await self.promotion_planner.plan(users, nodes)
+        queued = await self.job_queue.enqueue(
+            [promote_job(user_id, room_id) for user_id, room_id in pairs],
+            requeue_done=True
+        )
+        # rooms added while we were planning are promoted on the next update
+        async with self.tree_cache.lock(tree.root.id):
+            promoted = set(rooms)
+            tree.childs_which_need_user_promotion = [
+                room_id for room_id in tree.childs_which_need_user_promotion
+                if room_id not in promoted
+            ]
+        self.logger.debug("Queued promotions.", extra={"planned": len(pairs), "queued": queued})
 
-    async def _log_errors(
-        self,
-        responses: list[tuple[str, str, RoomSendResponse | RoomSendError]]
-    ):
-        for response in responses:
-            if isinstance(response[2], RoomSendError):
-                self.logger.error(
-                    f"Error promoting user {response[0]} in room {response[1]}: "
-                    f"{response[2].message}"
-                )
-            else:
-                self.logger.debug(
-                    f"Successfully promoted user {response[0]} in room {response[1]}."
-                )
+@singleton
+class UpdateTreeSnapshotOnTreeStructureUpdate(CoreListenerInterface[TreeStructureUpdated]):
+    """Persists the updated tree, so a restart can serve it right away."""
+
+    @inject
+    def __init__(self, tree_cache: MatrixTreeCache, logger: CoreLogger):
+        self.tree_cache = tree_cache
+        self.logger = logger
+
+    def getEventType(self) -> type[TreeStructureUpdated]:
+        return TreeStructureUpdated
+
+    async def onEvent(self, event: TreeStructureUpdated):
+        room_id = event.tree.root.id
+        if self.tree_cache.get(room_id) is not event.tree:
+            return
+        version = await self.tree_cache.save(room_id)
+        self.logger.debug(f"Saved snapshot version {version} of room tree {room_id}.")
 
 class InternalListenerCollectionModule(Module):
     @multiprovider
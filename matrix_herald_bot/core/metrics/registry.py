@@ -0,0 +1,160 @@
+import bisect
+from collections.abc import Callable
+from injector import singleton
+
+# seconds, from a quick state lookup up to a crawl of a large space
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0
+)
+
+type Labels = tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+
+    def _key(self, labels: dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+class CounterMetric(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Labels):
+        super().__init__(name, description, labels)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self.values.items()
+        ]
+
+class GaugeMetric(CounterMetric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        self.values[self._key(labels)] = value
+
+    def clear(self):
+        self.values.clear()
+
+class HistogramMetric(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Labels,
+        buckets: tuple[float, ...]
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (observations per bucket, +Inf last), sum
+        self.series: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0])
+            self.series[key] = series
+        counts, total = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+@singleton
+class MetricsRegistry:
+    """
+    Metrics of the running bot in the Prometheus text format. Services create
+    their metrics once (repeated calls return the existing metric) and may add
+    collectors, which update gauges right before the metrics are rendered.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+        self.collectors: list[Callable[[], None]] = []
+
+    def counter(self, name: str, description: str, labels: Labels = ()) -> CounterMetric:
+        return self._get_or_create(name, lambda: CounterMetric(name, description, labels))
+
+    def gauge(self, name: str, description: str, labels: Labels = ()) -> GaugeMetric:
+        return self._get_or_create(name, lambda: GaugeMetric(name, description, labels))
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labels: Labels = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> HistogramMetric:
+        return self._get_or_create(
+            name,
+            lambda: HistogramMetric(name, description, labels, buckets)
+        )
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _get_or_create[M: _Metric](self, name: str, create: Callable[[], M]) -> M:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = create()
+            self.metrics[name] = metric
+        return metric # type: ignore[return-value]
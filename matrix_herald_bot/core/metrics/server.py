@@ -0,0 +1,44 @@
+from aiohttp import web
+from injector import inject, singleton
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.core.logging.loggers import CoreLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
+
+@singleton
+class MetricsServer:
+    """Serves the metrics on /metrics if a METRICS_PORT is configured."""
+
+    @inject
+    def __init__(self, config: Configuration, registry: MetricsRegistry, logger: CoreLogger):
+        self.config = config
+        self.registry = registry
+        self.logger = logger
+        self._runner: web.AppRunner | None = None
+
+    async def start(self):
+        if not self.config.metrics_port or self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.config.metrics_host, self.config.metrics_port)
+        await site.start()
+        self.logger.info(
+            f"Serving metrics on http://{self.config.metrics_host}:"
+            f"{self.config.metrics_port}/metrics."
+        )
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, _request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            charset="utf-8",
+            headers={"X-Content-Type-Options": "nosniff"}
+        )
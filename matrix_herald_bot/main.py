@@ -9,11 +9,13 @@ from matrix_herald_bot.services.listeners import MatrixListenerCollectionModule
 from matrix_herald_bot.services.commands import (
     HeraldBotEventLoop,
     PrintAllUnreadNotifications,
+    PrintInaccessibleRooms,
     PrintMatrixTreesOfWatchedSpaceCmd,
     PrintUnreadNotifications,
     PrintUsersInAnnouncementRoom,
     PromoteToServerAdmin,
     PromoteUsersInAnnouncementRoom,
+    PurgeInaccessibleRooms,
     SendTreeToWidget
 )
 
@@ -49,6 +51,12 @@ async def async_main():
     # cmd = injector.get(PrintAllUnreadNotifications)
     # await cmd.print_all_unread_notifications()
 
+    # cmd = injector.get(PrintInaccessibleRooms)
+    # await cmd.print_inaccessible_rooms()
+
+    # cmd = injector.get(PurgeInaccessibleRooms)
+    # await cmd.purge_inaccessible_rooms()
+
     # Starte den Bot Event Loop
     cmd = injector.get(HeraldBotEventLoop)
     await cmd.start()
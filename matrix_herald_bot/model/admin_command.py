@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+from matrix_herald_bot.model.enums import AdminCommandStatus
+
+@dataclass
+class AdminCommandResult:
+    command: str
+    status: AdminCommandStatus
+    # from sending the command until its reply (or the send response)
+    latency_s: float
+    event_id: str | None = None
+    reply: str | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (AdminCommandStatus.SENT, AdminCommandStatus.SUCCEEDED)
@@ -4,3 +4,37 @@ class MatrixNodeType(Enum):
     ROOM = "room"
     SPACE = "space"
     UNKNOWN = "unknown"
+
+class RequestPriority(Enum):
+    """Priority classes of outbound homeserver requests."""
+    INTERACTIVE = "interactive"
+    TREE_MAINTENANCE = "tree_maintenance"
+    BULK_ADMIN = "bulk_admin"
+
+class AdminCommandStatus(Enum):
+    """Outcome of a command sent to the admin room."""
+    # sent, but no reply was awaited
+    SENT = "sent"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    TIMED_OUT = "timed_out"
+    SEND_FAILED = "send_failed"
+
+class JobKind(Enum):
+    """Kinds of jobs in the durable job queue."""
+    PROMOTE = "promote"
+    WIDGET_PUSH = "widget_push"
+
+class JobStatus(Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class EventLagStage(Enum):
+    """Points after origin_server_ts at which the lag of a Matrix event is measured."""
+    RECEIVED = "received"
+    HANDLER_STARTED = "handler_started"
+    HANDLED = "handled"
+    # the widgets show the tree change the event caused
+    WIDGET_PUSHED = "widget_pushed"
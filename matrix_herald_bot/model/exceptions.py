@@ -1,2 +1,17 @@
 class NotConnectedError(Exception):
     pass
+
+class RequestShedError(Exception):
+    """A request was rejected because the queue of its priority class is full."""
+
+    def __init__(self, priority: str, queued: int):
+        self.priority = priority
+        self.queued = queued
+        super().__init__(f"Shedding {priority} request, {queued} requests already queued.")
+
+class JobFailedError(Exception):
+    """Raised by job handlers. Retryable jobs are queued again until they run out of attempts."""
+
+    def __init__(self, message: str, retryable: bool = False):
+        self.retryable = retryable
+        super().__init__(message)
@@ -1,13 +1,24 @@
+from collections import Counter
 from matrix_herald_bot.model.tree_node import MatrixTreeNode, MatrixWidget
-from matrix_herald_bot.util.tree_iterator import MatrixTreeIterator
 
 class MatrixTree:
+    """
+    A room tree with indexes which are kept up to date on every mutation:
+
+    - room id -> nodes (a room can be listed by several spaces)
+    - room id -> ids of the rooms listing it as child (with multiplicity)
+    - room id -> herald widget
+
+    Lookups and membership tests are O(1), mutations O(subtree).
+    """
+
     def __init__(self, root: MatrixTreeNode) -> None:
         self._root: MatrixTreeNode = root
-        self._cache_build = False
-        self._child_id_cache: list[str] = []
-        self._herald_widget_cache: list[MatrixWidget] = []
+        self._nodes: dict[str, list[MatrixTreeNode]] = {}
+        self._parents: dict[str, Counter[str]] = {}
+        self._herald_widgets: dict[str, MatrixWidget] = {}
         self.childs_which_need_user_promotion = []
+        self._index_subtree(root, None)
 
     @property
     def root(self) -> MatrixTreeNode:
@@ -16,56 +27,112 @@ class MatrixTree:
     @root.setter
     def root(self, value: MatrixTreeNode):
         self._root = value
-        self._cache_build = False
+        self._nodes = {}
+        self._parents = {}
+        self._herald_widgets = {}
+        self._index_subtree(value, None)
 
     @property
     def child_ids(self) -> list[str]:
-        if not self._cache_build:
-            self._build_cache()
-        return self._child_id_cache
+        """Ids of all rooms in the tree (root included), each listed once."""
+        return list(self._nodes)
 
     @property
     def herald_widgets(self) -> list[MatrixWidget]:
-        if not self._cache_build:
-            self._build_cache()
-        return self._herald_widget_cache
-
-    def _build_cache(self):
-        stack = [self._root]
-        self._child_id_cache = []
-        self._herald_widget_cache = []
-        while stack:
-            node = stack.pop()
-            self._child_id_cache.append(node.id)
-            if node.herald_widget is not None:
-                widget = MatrixWidget(node.herald_widget, node.id)
-                self._herald_widget_cache.append(widget)
-            stack.extend(node.childs)
+        return list(self._herald_widgets.values())
+
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def get_nodes(self, room_id: str) -> list[MatrixTreeNode]:
+        """All nodes of the room, in the order they were added to the tree."""
+        return list(self._nodes.get(room_id, []))
+
+    def get_node(self, room_id: str) -> MatrixTreeNode | None:
+        nodes = self._nodes.get(room_id)
+        return nodes[0] if nodes else None
+
+    def get_public_nodes(self) -> list[MatrixTreeNode]:
+        """The first node of every public room in the tree."""
+        return [nodes[0] for nodes in self._nodes.values() if nodes[0].public]
+
+    def get_parent_ids(self, room_id: str) -> list[str]:
+        return list(self._parents.get(room_id, {}))
 
     def convert_to_dict(self, exclude_defective=True) -> dict|None:
         return self.root.convert_to_dict(exclude_defective)
 
+    def convert_to_snapshot_dict(self) -> dict:
+        return {
+            "root": self.root.convert_to_snapshot_dict(),
+            "childs_which_need_user_promotion": self.childs_which_need_user_promotion,
+        }
+
+    @classmethod
+    def from_snapshot_dict(cls, data: dict) -> "MatrixTree":
+        tree = cls(MatrixTreeNode.from_snapshot_dict(data["root"]))
+        tree.childs_which_need_user_promotion = list(data["childs_which_need_user_promotion"])
+        return tree
+
     def add_node(self, parent_room_id: str, node: MatrixTreeNode):
-        for tree_node in MatrixTreeIterator(self._root):
-            if tree_node.id == parent_room_id:
-                tree_node.childs.append(node)
-                self._cache_build = False
-                return
+        parent = self.get_node(parent_room_id)
+        if parent is None:
+            raise ValueError(f"Parent room '{parent_room_id}' not found in tree.")
 
-        raise ValueError(f"Parent room '{parent_room_id}' not found in tree.")
+        parent.childs.append(node)
+        self._index_subtree(node, parent_room_id)
 
     def remove_node(self, parent_room_id: str, removed_node_id: str):
-        for tree_node in MatrixTreeIterator(self._root):
-            if tree_node.id == parent_room_id:
-                tree_node.childs = [
-                    child for child in tree_node.childs
-                    if child.id != removed_node_id
-                ]
-                self.childs_which_need_user_promotion = [
-                    child for child in self.childs_which_need_user_promotion
-                    if child != removed_node_id
-                ]
-                self._cache_build = False
-                return
-
-        raise ValueError(f"Parent room '{parent_room_id}' not found in tree.")
+        parent = self.get_node(parent_room_id)
+        if parent is None:
+            raise ValueError(f"Parent room '{parent_room_id}' not found in tree.")
+
+        removed = [child for child in parent.childs if child.id == removed_node_id]
+        parent.childs = [
+            child for child in parent.childs
+            if child.id != removed_node_id
+        ]
+        for child in removed:
+            self._unindex_subtree(child, parent_room_id)
+
+        self.childs_which_need_user_promotion = [
+            child for child in self.childs_which_need_user_promotion
+            if child != removed_node_id
+        ]
+
+    def _index_subtree(self, node: MatrixTreeNode, parent_id: str | None):
+        # pre-order, so the first indexed node of a room is the first one a
+        # MatrixTreeIterator would visit
+        stack: list[tuple[MatrixTreeNode, str | None]] = [(node, parent_id)]
+        while stack:
+            current, current_parent_id = stack.pop()
+            self._nodes.setdefault(current.id, []).append(current)
+            if current_parent_id is not None:
+                self._parents.setdefault(current.id, Counter())[current_parent_id] += 1
+            if current.herald_widget is not None and current.id not in self._herald_widgets:
+                self._herald_widgets[current.id] = MatrixWidget(current.herald_widget, current.id)
+            stack.extend((child, current.id) for child in reversed(current.childs))
+
+    def _unindex_subtree(self, node: MatrixTreeNode, parent_id: str | None):
+        stack: list[tuple[MatrixTreeNode, str | None]] = [(node, parent_id)]
+        while stack:
+            current, current_parent_id = stack.pop()
+
+            nodes = self._nodes[current.id]
+            nodes.remove(next(n for n in nodes if n is current))
+            if not nodes:
+                del self._nodes[current.id]
+                self._herald_widgets.pop(current.id, None)
+
+            if current_parent_id is not None:
+                parents = self._parents[current.id]
+                parents[current_parent_id] -= 1
+                if parents[current_parent_id] <= 0:
+                    del parents[current_parent_id]
+                if not parents:
+                    del self._parents[current.id]
+
+            stack.extend((child, current.id) for child in current.childs)
@@ -19,6 +19,10 @@ class MatrixTreeNode:
     public: bool = False
     herald_widget: str | None = None
     events: list|None = None
+    # ids of space childs which point back to an ancestor of this node
+    cyclic_childs: list[str] = field(default_factory=list)
+    # content of m.room.power_levels, {} if the room has none, None if not fetched
+    power_levels: dict | None = None
 
     def get_childs_sorted_by_type(self) -> list["MatrixTreeNode"]:
         type_order = {
@@ -47,6 +51,43 @@ class MatrixTreeNode:
             ]
         }
 
+    def convert_to_snapshot_dict(self) -> dict:
+        """Lossless representation for the local tree snapshot (without raw events)."""
+        return {
+            "id": self.id,
+            "name": self.name,
+            "canonical_alias": self.canonical_alias,
+            "type": self.type_.value,
+            "access": self.access,
+            "error": {
+                "message": self.error.message,
+                "status_code": self.error.status_code,
+            } if self.error else None,
+            "public": self.public,
+            "herald_widget": self.herald_widget,
+            "cyclic_childs": self.cyclic_childs,
+            "power_levels": self.power_levels,
+            "childs": [child.convert_to_snapshot_dict() for child in self.childs],
+        }
+
+    @classmethod
+    def from_snapshot_dict(cls, data: dict) -> "MatrixTreeNode":
+        error = data["error"]
+        return cls(
+            data["id"],
+            data["name"],
+            data["canonical_alias"],
+            MatrixNodeType(data["type"]),
+            [cls.from_snapshot_dict(child) for child in data["childs"]],
+            data["access"],
+            RoomGetStateError(error["message"], error["status_code"]) if error else None,
+            data["public"],
+            data["herald_widget"],
+            None,
+            data["cyclic_childs"],
+            data.get("power_levels"),
+        )
+
     def convert_to_event_dict(self) -> dict:
         if isinstance(self.error, RoomGetStateError):
             return {
@@ -57,5 +98,6 @@ class MatrixTreeNode:
         return {
             "id": self.id,
             "events": self.events,
+            "cyclic_childs": self.cyclic_childs,
             "childs": [child.convert_to_event_dict() for child in self.childs]
         }
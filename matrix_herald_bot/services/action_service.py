@@ -1,8 +1,19 @@
+import asyncio
+from collections import Counter
 from injector import inject, singleton
-from nio import JoinError, JoinResponse, RoomGetStateError, RoomPutStateError, RoomPutStateResponse
+from nio import (
+    JoinError,
+    JoinResponse,
+    JoinedMembersError,
+    JoinedRoomsError,
+    RoomGetStateError,
+    RoomPutStateError,
+    RoomPutStateResponse
+)
 from matrix_herald_bot.config.model import Configuration
-from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
 from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.services.state_service import MatrixStateService
 from matrix_herald_bot.util.exceptions import NioErrorResponseException
 
 @singleton
@@ -12,42 +23,71 @@ class MatrixActionService:
     @inject
     def __init__(
         self,
-        connection: Connection,
+        scheduler: MatrixRequestScheduler,
         config: Configuration,
-        logger: MatrixLogger
+        logger: MatrixLogger,
+        state_service: MatrixStateService
     ):
         self.config = config
-        self.connection = connection
+        self.scheduler = scheduler
         self.logger = logger
+        self.state_service = state_service
+        # joined / skipped (already joined) / failed joins since start
+        self.join_stats: Counter[str] = Counter()
+        # rooms the bot is in: /joined_rooms once, then kept up to date
+        self._joined_rooms: set[str] | None = None
+        self._joined_rooms_lock = asyncio.Lock()
 
     async def join_room(self, room_id: str) -> JoinResponse | JoinError:
-        client = self.connection.get_client_or_raise()
-        response = await client.join(room_id)
+        response = await self.scheduler.request("join", lambda c: c.join(room_id))
         if isinstance(response, JoinError):
+            self.join_stats["failed"] += 1
             self.logger.error(f"Bot failed to join room {room_id}: {response.message}")
         else:
+            self.join_stats["joined"] += 1
+            self.mark_joined(room_id)
             self.logger.debug(f"Bot successfully joined room {room_id}")
         return response
 
-    async def get_users_in_room(self, room_id: str) -> list[str]|RoomGetStateError:
-        client = self.connection.get_client_or_raise()
-        state = await client.room_get_state(room_id)
+    async def join_room_if_needed(self, room_id: str) -> JoinResponse | JoinError | None:
+        """Join the room unless the bot is in it already, None in that case."""
+        # not the client's room list: nio keeps rooms there after leaving them
+        if room_id in await self._get_joined_rooms():
+            self.join_stats["skipped"] += 1
+            return None
+        return await self.join_room(room_id)
 
-        if isinstance(state, RoomGetStateError):
-            return state
+    def mark_joined(self, room_id: str):
+        if self._joined_rooms is not None:
+            self._joined_rooms.add(room_id)
 
-        return [
-            ev["state_key"]
-            for ev in state.events
-            if ev["type"] == "m.room.member" and ev.get("content", {}).get("membership") == "join"
-        ]
+    def mark_left(self, room_id: str):
+        if self._joined_rooms is not None:
+            self._joined_rooms.discard(room_id)
 
-    async def get_users_in_announcement_room(self) -> list[str]|RoomGetStateError:
+    async def _get_joined_rooms(self) -> set[str]:
+        async with self._joined_rooms_lock:
+            if self._joined_rooms is None:
+                response = await self.scheduler.request(
+                    "joined_rooms",
+                    lambda c: c.joined_rooms()
+                )
+                if isinstance(response, JoinedRoomsError):
+                    # joins everything until the next attempt succeeds
+                    self.logger.warning(f"Could not fetch joined rooms: {response.message}")
+                    return set()
+                self._joined_rooms = set(response.rooms)
+            return self._joined_rooms
+
+    async def get_users_in_room(self, room_id: str) -> list[str]|JoinedMembersError:
+        return await self.state_service.get_joined_members(room_id)
+
+    async def get_users_in_announcement_room(self) -> list[str]|JoinedMembersError:
         return await self.get_users_in_room(self.config.announcement_room)
 
     async def get_users_in_announcement_room_or_raise(self) -> list[str]:
         resp = await self.get_users_in_room(self.config.announcement_room)
-        if isinstance(resp, RoomGetStateError):
+        if isinstance(resp, JoinedMembersError):
             raise NioErrorResponseException(resp)
         return resp
 
@@ -58,18 +98,16 @@ class MatrixActionService:
         content: dict,
         state_key=""
     ) -> RoomPutStateResponse|RoomPutStateError:
-        client = self.connection.get_client_or_raise()
-
-        return await client.room_put_state(
-            room_id,
-            event_type,
-            content,
-            state_key
+        return await self.scheduler.request(
+            "room_put_state",
+            lambda c: c.room_put_state(room_id, event_type, content, state_key)
         )
 
     async def print_room_info(self, room_id: str):
-        client = self.connection.get_client_or_raise()
-        state_events = await client.room_get_state(room_id)
+        state_events = await self.scheduler.request(
+            "room_get_state",
+            lambda c: c.room_get_state(room_id)
+        )
 
         if isinstance(state_events, RoomGetStateError):
             print(f"Fehler beim Abrufen der Rauminformationen: {state_events}")
@@ -1,35 +1,167 @@
 import asyncio
-from itertools import product
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
 from injector import inject, singleton
-from nio import RoomSendError, RoomSendResponse
+from nio import RoomSendError
 from matrix_herald_bot.config.model import Configuration
-from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.model.admin_command import AdminCommandResult
+from matrix_herald_bot.model.enums import AdminCommandStatus, RequestPriority
+
+# Tuwunel starts the reply with one of these if a command failed to run
+# ("Command failed with error/panic") or could not be parsed (clap errors)
+ADMIN_REPLY_ERROR_PREFIXES = (
+    "Command failed",
+    "error:",
+)
+
+# replies to commands which are not (yet) known, e.g. because the reply came
+# in before the send response
+MAX_UNCLAIMED_REPLIES = 100
+
+@dataclass
+class _PendingAdminCommand:
+    command: str
+    reply: asyncio.Future[str]
 
 @singleton
 class TuwunelAdminService:
-    """Provides administrative Matrix operations (power levels, invites, etc.)."""
+    """
+    Provides administrative Matrix operations (power levels, invites, etc.).
+
+    Commands are sent to the admin room. While reply tracking is on (the sync
+    loop is running), each command keeps one of a bounded number of slots
+    until the admin bot replied to it, and its result reflects that reply.
+    Replies are matched by the event they reply to, or else in send order.
+    """
 
     @inject
-    def __init__(self, config: Configuration, connection: Connection):
+    def __init__(
+        self,
+        config: Configuration,
+        scheduler: MatrixRequestScheduler,
+        logger: MatrixLogger
+    ):
         self.config = config
-        self.connection = connection
+        self.scheduler = scheduler
+        self.logger = logger
+        self.stats: Counter[AdminCommandStatus] = Counter()
+        self._in_flight = asyncio.Semaphore(config.admin_command_concurrency)
+        self._track_replies = False
+        # event id of the command -> command awaiting its reply, in send order
+        self._pending: OrderedDict[str, _PendingAdminCommand] = OrderedDict()
+        self._unclaimed_replies: OrderedDict[str, str] = OrderedDict()
+
+    def start_reply_tracking(self):
+        """Await the admin bot's replies, which requires a running sync loop."""
+        self._track_replies = True
+
+    def handle_reply(self, body: str, in_reply_to: str | None):
+        """Hand a message of the admin bot in the admin room to its command."""
+        if in_reply_to is not None:
+            pending = self._pending.get(in_reply_to)
+            if pending is None:
+                self._unclaimed_replies[in_reply_to] = body
+                while len(self._unclaimed_replies) > MAX_UNCLAIMED_REPLIES:
+                    self._unclaimed_replies.popitem(last=False)
+                return
+        else:
+            pending = next(
+                (p for p in self._pending.values() if not p.reply.done()),
+                None
+            )
+            if pending is None:
+                self.logger.debug("Ignoring admin room message without pending command.")
+                return
+
+        if not pending.reply.done():
+            pending.reply.set_result(body)
+
+    async def _send_admin_command(self, command: str) -> AdminCommandResult:
+        """Send a command to the admin room and await its outcome."""
+        if not self._track_replies:
+            return await self._send(command)
+
+        async with self._in_flight:
+            return await self._send(command)
+
+    async def _send(self, command: str) -> AdminCommandResult:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        response = await self.scheduler.request(
+            "room_send",
+            lambda c: c.room_send(
+                room_id=self.config.admin_room_id,
+                message_type="m.room.message",
+                content={"msgtype": "m.text", "body": command}
+            ),
+            RequestPriority.BULK_ADMIN
+        )
+
+        if isinstance(response, RoomSendError):
+            return self._result(
+                command,
+                AdminCommandStatus.SEND_FAILED,
+                started,
+                error=response.message
+            )
+        if not self._track_replies:
+            return self._result(
+                command,
+                AdminCommandStatus.SENT,
+                started,
+                event_id=response.event_id
+            )
+
+        pending = _PendingAdminCommand(command, loop.create_future())
+        self._pending[response.event_id] = pending
+        if (early := self._unclaimed_replies.pop(response.event_id, None)) is not None:
+            pending.reply.set_result(early)
 
-    async def _send_admin_command(self, command: str) -> RoomSendResponse | RoomSendError:
-        """Send a command to the admin room."""
-        client = self.connection.get_client_or_raise()
+        try:
+            async with asyncio.timeout(self.config.admin_command_timeout_s):
+                reply = await pending.reply
+        except TimeoutError:
+            return self._result(
+                command,
+                AdminCommandStatus.TIMED_OUT,
+                started,
+                event_id=response.event_id
+            )
+        finally:
+            self._pending.pop(response.event_id, None)
 
-        resp = await client.room_send(
-            room_id=self.config.admin_room_id,
-            message_type="m.room.message",
-            content={"msgtype": "m.text", "body": command}
+        failed = self._reply_reports_failure(reply)
+        return self._result(
+            command,
+            AdminCommandStatus.FAILED if failed else AdminCommandStatus.SUCCEEDED,
+            started,
+            event_id=response.event_id,
+            reply=reply,
+            error=reply if failed else None
         )
-        return resp
 
-    async def force_promote(
+    def _result(
         self,
-        user_id: str,
-        room_id: str
-    ) -> RoomSendResponse | RoomSendError:
+        command: str,
+        status: AdminCommandStatus,
+        started: float,
+        **kwargs
+    ) -> AdminCommandResult:
+        self.stats[status] += 1
+        latency = asyncio.get_running_loop().time() - started
+        return AdminCommandResult(command, status, latency, **kwargs)
+
+    @staticmethod
+    def _reply_reports_failure(reply: str) -> bool:
+        # drop the quote of the command in reply fallbacks
+        text = "\n".join(
+            line for line in reply.splitlines() if not line.startswith(">")
+        ).lstrip()
+        return text.startswith(ADMIN_REPLY_ERROR_PREFIXES)
+
+    async def force_promote(self, user_id: str, room_id: str) -> AdminCommandResult:
         cmd = f"!admin users force-promote {user_id} {room_id}"
         return await self._send_admin_command(cmd)
 
@@ -37,38 +169,17 @@ class TuwunelAdminService:
         self,
         users: list[str],
         room_id: str
-    ) -> list[RoomSendResponse | RoomSendError]:
+    ) -> list[AdminCommandResult]:
         tasks = [
             self.force_promote(user_id, room_id)
             for user_id in users
         ]
         return await asyncio.gather(*tasks)
 
-    async def force_promote_users_in_rooms(
-        self,
-        users: list[str],
-        rooms: list[str]
-    ) -> list[tuple[str, str, RoomSendResponse | RoomSendError]]:
-        tasks = [
-            self.force_promote(user_id, room_id)
-            for room_id in rooms
-            for user_id in users
-        ]
-        result = await asyncio.gather(*tasks)
-        return [
-            (user_id, room_id, res)
-            for (user_id, room_id), res
-            in zip(product(users, rooms), result)
-        ]
-
-    async def force_join_room(
-        self,
-        user_id: str,
-        room_id: str
-    ) -> RoomSendResponse | RoomSendError:
+    async def force_join_room(self, user_id: str, room_id: str) -> AdminCommandResult:
         cmd = f"!admin users force-join-room {user_id} {room_id}"
         return await self._send_admin_command(cmd)
 
-    async def make_user_admin(self, user_id: str) -> RoomSendResponse | RoomSendError:
+    async def make_user_admin(self, user_id: str) -> AdminCommandResult:
         cmd = f"!admin users make-user-admin {user_id}"
         return await self._send_admin_command(cmd)
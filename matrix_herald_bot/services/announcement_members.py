@@ -0,0 +1,34 @@
+import asyncio
+from injector import inject, singleton
+from nio import RoomMemberEvent
+from matrix_herald_bot.services.action_service import MatrixActionService
+
+@singleton
+class AnnouncementRoomMembers:
+    """
+    The joined members of the announcement room. Loaded once, afterwards
+    kept up to date from the m.room.member events of the sync loop.
+    """
+
+    @inject
+    def __init__(self, action_service: MatrixActionService):
+        self.action_service = action_service
+        self._members: set[str] | None = None
+        self._load_lock = asyncio.Lock()
+
+    async def get_or_raise(self) -> list[str]:
+        async with self._load_lock:
+            if self._members is None:
+                members = await self.action_service.get_users_in_announcement_room_or_raise()
+                self._members = set(members)
+        return sorted(self._members)
+
+    def apply(self, event: RoomMemberEvent) -> bool:
+        """Update the members, returns whether the event is a join."""
+        joined = event.membership == "join" and event.prev_membership != "join"
+        if self._members is not None:
+            if event.membership == "join":
+                self._members.add(event.state_key)
+            else:
+                self._members.discard(event.state_key)
+        return joined
@@ -1,17 +1,47 @@
+import asyncio
 import json
+import time
+from collections import Counter
+from functools import partial
 from aiohttp import ClientSession
 from injector import inject, singleton
-from nio import RoomGetStateError, RoomPutStateError, UploadFilterError
+from nio import (
+    AsyncClient,
+    JoinedMembersError,
+    RoomPutStateError,
+    SyncError,
+    SyncResponse,
+    UploadFilterError
+)
 from matrix_herald_bot.config.model import Configuration
-from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.connection import Connection, HeraldAsyncClient
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+from matrix_herald_bot.core.event.bus import EventBus
 from matrix_herald_bot.core.logging.loggers import CoreLogger, MatrixLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
+from matrix_herald_bot.core.metrics.server import MetricsServer
 from matrix_herald_bot.services.tree_builder import MatrixTreeBuilder
 from matrix_herald_bot.services.tree_printer import MatrixTreePrinter
 from matrix_herald_bot.services.admin_service import TuwunelAdminService
 from matrix_herald_bot.services.action_service import MatrixActionService
 from matrix_herald_bot.services.tree_operations import MatrixTreeOperations
 from matrix_herald_bot.services.notification_service import NotificationService
+from matrix_herald_bot.services.event_dispatcher import MatrixEventDispatcher
 from matrix_herald_bot.services.listeners import ListenerInterface
+from matrix_herald_bot.services.room_event_fetcher import MatrixRoomEventFetcher
+from matrix_herald_bot.services.sync_filter import build_first_sync_filter, build_sync_filter
+from matrix_herald_bot.services.inaccessible_rooms import InaccessibleRoomCache
+from matrix_herald_bot.services.job_queue import MatrixJobQueue
+from matrix_herald_bot.services.tree_cache import MatrixTreeCache
+from matrix_herald_bot.services.tree_reconciler import MatrixTreeReconciler
+from matrix_herald_bot.storage.sync_state import SyncStateStore
+
+# syncs between two logged sync payload summaries
+SYNC_STATS_LOG_EVERY = 100
+# long-polling timeout of the sync loop
+SYNC_TIMEOUT_MS = 3000
+# wait before retrying a failed sync if the server did not say how long
+SYNC_RETRY_DELAY_MS = 5000
 
 @singleton
 class PrintMatrixTreesOfWatchedSpaceCmd:
@@ -86,15 +116,19 @@ class PromoteUsersInAnnouncementRoom:
         action_service: MatrixActionService,
         tree_builder: MatrixTreeBuilder,
         tree_operations: MatrixTreeOperations,
+        job_queue: MatrixJobQueue
     ):
         self.config = config
         self.connection = connection
         self.tree_builder = tree_builder
         self.action_service = action_service
         self.tree_operations = tree_operations
+        self.job_queue = job_queue
 
     async def promote_users_in_announcement_room(self):
         await self.connection.connect()
+        # finishes the jobs of an interrupted earlier run first
+        await self.job_queue.start()
 
         print(
             "Promoting the users in the announcement room to be admin in all "+
@@ -102,7 +136,7 @@ class PromoteUsersInAnnouncementRoom:
         )
 
         users = await self.action_service.get_users_in_announcement_room()
-        if isinstance(users, RoomGetStateError):
+        if isinstance(users, JoinedMembersError):
             print(f"Error fetching users in announcement room: {users}")
             return
 
@@ -137,18 +171,39 @@ class SendTreeToWidget:
 
         room = self.config.watched_space
         tree = await self.tree_builder.fetch_tree(room)
-        response = await self.tree_operations.send_tree_to_room(
-            tree.root,
-            room_id,
-            "org.herald.tree_structure"
-        )
+        response = await self.tree_operations.send_tree_to_room(tree, room_id, force=True)
         if isinstance(response, RoomPutStateError):
             print(f"Fehler beim Senden: {response.message}")
-        else:
+        elif response is not None:
             print(f"Tree-Struktur gesendet: {response.event_id}")
 
         await self.connection.close()
 
+@singleton
+class PrintInaccessibleRooms:
+    @inject
+    def __init__(self, inaccessible_rooms: InaccessibleRoomCache):
+        self.inaccessible_rooms = inaccessible_rooms
+
+    async def print_inaccessible_rooms(self):
+        now = time.time()
+        for room in await self.inaccessible_rooms.entries():
+            print(
+                f"{room.room_id}: {room.error_class} ({room.message}), "
+                f"{room.failures} failures, retry in {max(0, room.retry_at - now):.0f}s"
+            )
+
+@singleton
+class PurgeInaccessibleRooms:
+    @inject
+    def __init__(self, inaccessible_rooms: InaccessibleRoomCache):
+        self.inaccessible_rooms = inaccessible_rooms
+
+    async def purge_inaccessible_rooms(self, room_ids: list[str] | None = None):
+        """Let the next crawl retry the rooms (all rooms without room_ids)."""
+        purged = await self.inaccessible_rooms.purge(room_ids)
+        print(f"Purged {purged} inaccessible rooms.")
+
 @singleton
 class PrintUnreadNotifications:
     @inject
@@ -253,34 +308,221 @@ class HeraldBotEventLoop:
         self,
         connection: Connection,
         listeners: list[ListenerInterface],
-        logger: CoreLogger
+        logger: CoreLogger,
+        config: Configuration,
+        tree_cache: MatrixTreeCache,
+        tree_reconciler: MatrixTreeReconciler,
+        sync_state: SyncStateStore,
+        scheduler: MatrixRequestScheduler,
+        admin_service: TuwunelAdminService,
+        action_service: MatrixActionService,
+        job_queue: MatrixJobQueue,
+        dispatcher: MatrixEventDispatcher,
+        room_event_fetcher: MatrixRoomEventFetcher,
+        metrics: MetricsRegistry,
+        metrics_server: MetricsServer,
+        event_bus: EventBus
     ):
         self.connection = connection
+        self.event_bus = event_bus
+        self.metrics_server = metrics_server
+        self.dispatcher = dispatcher
+        self.room_event_fetcher = room_event_fetcher
+        self.job_queue = job_queue
+        self.admin_service = admin_service
+        self.action_service = action_service
+        self.scheduler = scheduler
         self.listeners = listeners
         self.logger = logger
+        self.config = config
+        self.tree_cache = tree_cache
+        self.tree_reconciler = tree_reconciler
+        self.sync_state = sync_state
+        self._background_tasks: set[asyncio.Task] = set()
+        self._sync_stats: Counter[str] = Counter()
+        self._sync_parse_total_s = 0.0
+        self._last_sync_at: float | None = None
+        self._sync_iteration = metrics.histogram(
+            "herald_sync_iteration_seconds",
+            "Time between two sync responses, including the long-poll timeout."
+        )
+        self._sync_parse = metrics.histogram(
+            "herald_sync_parse_seconds",
+            "Client side parse time of a sync response."
+        )
+        self._sync_bytes = metrics.counter(
+            "herald_sync_payload_bytes_total",
+            "Bytes of all received sync responses."
+        )
 
     async def start(self):
         """Connects to Matrix and runs the bot event loop."""
         self.logger.info("Starting Herald main event loop.")
+        await self.tree_cache.load_snapshots()
+        await self.metrics_server.start()
+        try:
+            await self._run()
+        finally:
+            await self.metrics_server.stop()
+
+    async def _run(self):
         await self.connection.connect()
 
         async with self.connection as c:
             client = c.get_client_or_raise()
-            for listener in self.listeners:
-                client.add_event_callback(listener.onEvent, listener.getEventType())
+            # nio annotates the callback as a coroutine instead of a coroutine function
+            client.add_response_callback(self._on_sync, SyncResponse) # type: ignore[arg-type]
+            # the admin bot's replies come in through the sync loop
+            self.admin_service.start_reply_tracking()
+            await self.job_queue.start()
+
+            # only what the listeners consume is sent and parsed; the events
+            # missed while down are still replayed to them on resume
+            sync_filter = await self._get_filter_id(build_sync_filter(self.listeners))
+            if sync_filter is None:
+                return
 
-            filter_response = await client.upload_filter(
-                room={"timeline": { "limit": 0},}
+            since = await self.sync_state.get_next_batch()
+            first_sync_filter = None
+            if since:
+                self.logger.info("Resuming sync from stored token.")
+            else:
+                first_sync_filter = await self._get_filter_id(
+                    build_first_sync_filter(self.listeners)
+                )
+                if first_sync_filter is None:
+                    return
+
+            if self.config.watched_space in self.tree_cache:
+                # serve the snapshot right away and catch up with the server meanwhile
+                self._run_in_background(self._reconcile_watched_space())
+
+            self.dispatcher.register(client)
+            self.dispatcher.start()
+            try:
+                await self._sync_forever(client, since, sync_filter, first_sync_filter)
+            finally:
+                # events not handled yet are synced again on the next start,
+                # as their sync token was not stored
+                await self.dispatcher.stop()
+                # tree updates held back for coalescing would be lost otherwise
+                await self.event_bus.flush()
+
+    async def _sync_forever(
+        self,
+        client: AsyncClient,
+        since: str | None,
+        sync_filter: str,
+        first_sync_filter: str | None
+    ):
+        """
+        Like AsyncClient.sync_forever, but a failed sync is retried with the
+        same token once the time the server asked for passed. The client does
+        not retry rate limited requests itself (see Connection), so nio's loop
+        would hammer the server and drop the token of a failed first sync.
+        """
+        first_sync = True
+        while True:
+            response = await client.sync(
+                timeout=0 if first_sync else SYNC_TIMEOUT_MS,
+                sync_filter=(first_sync_filter or sync_filter) if first_sync else sync_filter,
+                since=since,
+                full_state=False
             )
-
-            if isinstance(filter_response, UploadFilterError):
-                self.logger.error(
-                    f"Error connecting to matrix server: {filter_response.message}"
+            if isinstance(response, SyncError):
+                delay_ms = response.retry_after_ms or SYNC_RETRY_DELAY_MS
+                self.logger.warning(
+                    f"Sync failed ({response.status_code}: {response.message}), "
+                    f"retrying in {delay_ms} ms."
                 )
-                return
+                await asyncio.sleep(delay_ms / 1000)
+                continue
+
+            if since is not None:
+                # events of room scoped listeners are not part of the sync
+                await self.room_event_fetcher.fetch(since, response.next_batch)
+            await client.run_response_callbacks([response])
+            first_sync = False
+            since = response.next_batch
+
+    async def _get_filter_id(self, definition: dict) -> str | None:
+        """Return the id of the filter, uploading it only if it is not stored yet."""
+        user_id = self.config.server_admin_id
+        filter_id = await self.sync_state.get_filter_id(user_id, definition)
+        if filter_id is not None:
+            return filter_id
+
+        filter_response = await self.scheduler.request(
+            "upload_filter",
+            lambda c: c.upload_filter(**definition)
+        )
+
+        if isinstance(filter_response, UploadFilterError):
+            self.logger.error(
+                f"Error connecting to matrix server: {filter_response.message}"
+            )
+            return None
+
+        await self.sync_state.set_filter_id(user_id, definition, filter_response.filter_id)
+        return filter_response.filter_id
+
+    async def _on_sync(self, response: SyncResponse):
+        # member events are not synced, but a room is only listed under join
+        # (or leave) if the bot is in it (or left it)
+        for room_id in response.rooms.join:
+            self.action_service.mark_joined(room_id)
+        for room_id in response.rooms.leave:
+            self.action_service.mark_left(room_id)
+
+        # the token is stored once the events of this and all earlier syncs
+        # are handled, so it never points past events which were not handled
+        self.dispatcher.checkpoint(
+            partial(self.sync_state.set_next_batch, response.next_batch)
+        )
+        self._record_sync_payload()
+
+        now = time.monotonic()
+        if self._last_sync_at is not None:
+            self._sync_iteration.observe(now - self._last_sync_at)
+        self._last_sync_at = now
+
+    def _record_sync_payload(self):
+        client = self.connection.get_client()
+        if not isinstance(client, HeraldAsyncClient):
+            return
 
-            await client.sync_forever(
-                timeout=3000,
-                full_state=False,
-                first_sync_filter=filter_response.filter_id
+        stats = self._sync_stats
+        stats["syncs"] += 1
+        stats["bytes"] += client.last_sync_payload_bytes
+        self._sync_parse_total_s += client.last_sync_parse_s
+        self._sync_parse.observe(client.last_sync_parse_s)
+        self._sync_bytes.inc(client.last_sync_payload_bytes)
+        self.logger.debug(
+            "Sync received.",
+            extra={
+                "bytes": client.last_sync_payload_bytes,
+                "parse_ms": round(client.last_sync_parse_s * 1000, 2),
+            }
+        )
+        if stats["syncs"] % SYNC_STATS_LOG_EVERY == 0:
+            self.logger.info(
+                "Sync payload statistics.",
+                extra={
+                    "syncs": stats["syncs"],
+                    "avg_bytes": round(stats["bytes"] / stats["syncs"]),
+                    "avg_parse_ms": round(
+                        self._sync_parse_total_s / stats["syncs"] * 1000, 2
+                    ),
+                }
             )
+
+    async def _reconcile_watched_space(self):
+        try:
+            await self.tree_reconciler.refresh(self.config.watched_space)
+        except Exception: # pylint: disable=broad-exception-caught
+            self.logger.exception("Reconciling the room tree snapshot failed.")
+
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
@@ -0,0 +1,175 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+from injector import inject, singleton
+from nio import AsyncClient, Event, MatrixRoom
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
+from matrix_herald_bot.model.enums import EventLagStage
+from matrix_herald_bot.services.event_lag import MatrixEventLagTracker
+from matrix_herald_bot.services.listeners import ListenerInterface
+
+@dataclass
+class _QueuedEvent:
+    listener: ListenerInterface
+    room: MatrixRoom
+    event: Event
+    handled: asyncio.Future[None]
+
+@singleton
+class MatrixEventDispatcher:
+    """
+    Hands the events of the sync loop to a pool of workers instead of handling
+    them inline, so slow handlers (e.g. crawls) do not hold up the sync.
+
+    Events with the same dispatch key are handled one after another in the
+    order they were received, all others in parallel.
+    """
+
+    @inject
+    def __init__(
+        self,
+        listeners: list[ListenerInterface],
+        config: Configuration,
+        logger: MatrixLogger,
+        metrics: MetricsRegistry,
+        lag_tracker: MatrixEventLagTracker
+    ):
+        self.listeners = listeners
+        # listeners scoped to rooms get their events from MatrixRoomEventFetcher
+        self._sync_listeners = [
+            listener for listener in listeners if listener.getSyncRooms() is None
+        ]
+        self.lag_tracker = lag_tracker
+        self.config = config
+        self.logger = logger
+        # single events, or the dispatch key of a backlog to handle in order
+        self._ready: asyncio.Queue[_QueuedEvent | str] = asyncio.Queue()
+        self._backlogs: dict[str, deque[_QueuedEvent]] = {}
+        self._unhandled: set[asyncio.Future[None]] = set()
+        self._checkpoints: asyncio.Queue[
+            tuple[list[asyncio.Future[None]], Callable[[], Awaitable[Any]]]
+        ] = asyncio.Queue()
+        self._tasks: set[asyncio.Task] = set()
+        queue_depth = metrics.gauge(
+            "herald_sync_event_queue_depth",
+            "Events received by the sync loop which are not handled yet."
+        )
+        metrics.add_collector(lambda: queue_depth.set(self.queue_depth))
+
+    @property
+    def queue_depth(self) -> int:
+        """Events received but not handled yet."""
+        return len(self._unhandled)
+
+    def register(self, client: AsyncClient):
+        """Receive the events of the listeners from the client's sync loop."""
+        client.add_event_callback(self.receive, Event)
+
+    def start(self):
+        """Start the workers, once."""
+        if self._tasks:
+            return
+        for _ in range(self.config.event_workers):
+            self._spawn(self._work())
+        self._spawn(self._run_checkpoints())
+
+    async def stop(self):
+        """Stop the workers, events which are not handled yet are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def checkpoint(self, callback: Callable[[], Awaitable[Any]]):
+        """
+        Run the callback once all events received so far are handled.
+        Callbacks run one at a time in the order they were passed.
+        """
+        self._checkpoints.put_nowait((list(self._unhandled), callback))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def receive(
+        self,
+        room: MatrixRoom,
+        event: Event,
+        listeners: list[ListenerInterface] | None = None
+    ):
+        """
+        Hand the event to those of the listeners which consume it, by default
+        to the listeners which get their events from the sync.
+        """
+        consuming = [
+            listener for listener in (self._sync_listeners if listeners is None else listeners)
+            if isinstance(event, listener.getEventType())
+        ]
+        if not consuming:
+            return
+        self.lag_tracker.record(EventLagStage.RECEIVED, event.server_timestamp)
+        for listener in consuming:
+            self._submit(listener, room, event)
+
+    def _submit(self, listener: ListenerInterface, room: MatrixRoom, event: Event):
+        queued = _QueuedEvent(
+            listener,
+            room,
+            event,
+            asyncio.get_running_loop().create_future()
+        )
+        self._unhandled.add(queued.handled)
+
+        key = listener.getDispatchKey(room, event)
+        if key is None:
+            self._ready.put_nowait(queued)
+        elif (backlog := self._backlogs.get(key)) is not None:
+            backlog.append(queued)
+        else:
+            self._backlogs[key] = deque([queued])
+            self._ready.put_nowait(key)
+
+    async def _work(self):
+        while True:
+            item = await self._ready.get()
+            if isinstance(item, str):
+                await self._drain_backlog(item)
+            else:
+                await self._handle(item)
+
+    async def _drain_backlog(self, key: str):
+        backlog = self._backlogs[key]
+        while backlog:
+            await self._handle(backlog[0])
+            backlog.popleft()
+        del self._backlogs[key]
+
+    async def _handle(self, queued: _QueuedEvent):
+        listener = queued.listener
+        origin_server_ts = queued.event.server_timestamp
+        self.lag_tracker.record(EventLagStage.HANDLER_STARTED, origin_server_ts)
+        try:
+            await listener.onEvent(queued.room, queued.event)
+            self.lag_tracker.record(EventLagStage.HANDLED, origin_server_ts)
+        except Exception: # pylint: disable=broad-exception-caught
+            self.logger.exception(
+                f"{type(listener).__name__} failed to handle an event "
+                f"in room {queued.room.room_id}."
+            )
+        finally:
+            queued.handled.set_result(None)
+            self._unhandled.discard(queued.handled)
+
+    async def _run_checkpoints(self):
+        while True:
+            waiting, callback = await self._checkpoints.get()
+            if waiting:
+                await asyncio.wait(waiting)
+            try:
+                await callback()
+            except Exception: # pylint: disable=broad-exception-caught
+                self.logger.exception("Sync checkpoint failed.")
@@ -0,0 +1,165 @@
+import asyncio
+import math
+import time
+from collections import deque
+from injector import inject, singleton
+from nio import RoomSendError
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
+from matrix_herald_bot.model.enums import EventLagStage, RequestPriority
+from matrix_herald_bot.model.exceptions import RequestShedError
+
+# lags kept per stage, however many events come in during the window
+MAX_LAG_SAMPLES = 10_000
+# tree changes a widget room may wait for before newer ones are not tracked
+MAX_AWAITED_PUSHES = 100
+LAG_PERCENTILES = (50, 90, 99)
+
+@singleton
+class MatrixEventLagTracker:
+    """
+    Tracks how long after their origin_server_ts Matrix events are received,
+    handled and, for tree changes, shown by the herald widgets.
+
+    Lags are kept per stage over a rolling window. A lag above the SLO posts
+    a warning to the admin room, at most once per alert interval.
+    """
+
+    @inject
+    def __init__(
+        self,
+        config: Configuration,
+        scheduler: MatrixRequestScheduler,
+        logger: MatrixLogger,
+        metrics: MetricsRegistry
+    ):
+        self.config = config
+        self.scheduler = scheduler
+        self.logger = logger
+        # per stage: (recorded at, lag) in seconds
+        self._lags: dict[EventLagStage, deque[tuple[float, float]]] = {
+            stage: deque(maxlen=MAX_LAG_SAMPLES) for stage in EventLagStage
+        }
+        # widget room -> (origin, noted at) of tree changes it does not show yet
+        self._awaited_pushes: dict[str, list[tuple[float, float]]] = {}
+        self._last_alert_at: float | None = None
+        self._suppressed_alerts = 0
+        self._alert_tasks: set[asyncio.Task] = set()
+        self._lag_metric = metrics.histogram(
+            "herald_event_lag_seconds",
+            "Seconds from origin_server_ts of Matrix events to each processing stage.",
+            ("stage",),
+            buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0, 3600.0)
+        )
+        self._percentile_metric = metrics.gauge(
+            "herald_event_lag_percentile_seconds",
+            "Event lag percentiles per stage over the rolling window.",
+            ("stage", "percentile")
+        )
+        metrics.add_collector(self._collect_metrics)
+
+    def record(self, stage: EventLagStage, origin_server_ts: int):
+        """Record that an event sent at origin_server_ts (ms) reached the stage now."""
+        now = time.time()
+        self._record(stage, now - origin_server_ts / 1000, now)
+
+    def await_widget_pushes(self, origin_server_ts: int, widget_rooms: list[str]):
+        """Note that the widgets in the rooms do not show the tree change of the event yet."""
+        now = time.time()
+        for room_id in widget_rooms:
+            awaited = self._awaited_pushes.setdefault(room_id, [])
+            if len(awaited) < MAX_AWAITED_PUSHES:
+                awaited.append((origin_server_ts / 1000, now))
+
+    def widget_pushed(self, room_id: str, tree_read_at: float):
+        """The widget in the room shows the tree as it was at tree_read_at."""
+        awaited = self._awaited_pushes.get(room_id)
+        if not awaited:
+            return
+
+        now = time.time()
+        remaining = []
+        for origin, noted_at in awaited:
+            if noted_at <= tree_read_at:
+                self._record(EventLagStage.WIDGET_PUSHED, now - origin, now)
+            else:
+                remaining.append((origin, noted_at))
+        if remaining:
+            self._awaited_pushes[room_id] = remaining
+        else:
+            del self._awaited_pushes[room_id]
+
+    def percentiles(self, stage: EventLagStage) -> dict[int, float]:
+        """Nearest-rank lag percentiles of the stage within the window, empty without lags."""
+        lags = self._lags[stage]
+        cutoff = time.time() - self.config.event_lag_window_s
+        while lags and lags[0][0] < cutoff:
+            lags.popleft()
+        if not lags:
+            return {}
+
+        values = sorted(lag for _, lag in lags)
+        return {
+            p: values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+            for p in LAG_PERCENTILES
+        }
+
+    def _record(self, stage: EventLagStage, lag: float, now: float):
+        # clocks of servers differ a little
+        lag = max(0.0, lag)
+        self._lags[stage].append((now, lag))
+        self._lag_metric.observe(lag, stage=stage.value)
+        slo = self.config.event_lag_slo_s
+        if slo and lag > slo:
+            self._alert(stage, lag, now)
+
+    def _alert(self, stage: EventLagStage, lag: float, now: float):
+        if (
+            self._last_alert_at is not None
+            and now - self._last_alert_at < self.config.event_lag_alert_interval_s
+        ):
+            self._suppressed_alerts += 1
+            return
+        self._last_alert_at = now
+        suppressed, self._suppressed_alerts = self._suppressed_alerts, 0
+
+        percentiles = ", ".join(
+            f"p{p} {value:.1f}s" for p, value in self.percentiles(stage).items()
+        )
+        text = (
+            f"Event lag above SLO: {stage.value} {lag:.1f}s after the event was sent "
+            f"(SLO {self.config.event_lag_slo_s:g}s). Lags of the last "
+            f"{self.config.event_lag_window_s:g}s: {percentiles}."
+        )
+        if suppressed:
+            text += f" {suppressed} more breaches since the last warning."
+        self.logger.warning(text)
+
+        task = asyncio.create_task(self._post_alert(text))
+        self._alert_tasks.add(task)
+        task.add_done_callback(self._alert_tasks.discard)
+
+    async def _post_alert(self, text: str):
+        try:
+            response = await self.scheduler.request(
+                "room_send",
+                lambda c: c.room_send(
+                    room_id=self.config.admin_room_id,
+                    message_type="m.room.message",
+                    content={"msgtype": "m.notice", "body": text}
+                ),
+                RequestPriority.INTERACTIVE
+            )
+        except RequestShedError as e:
+            self.logger.error(f"Could not post event lag warning: {e}")
+            return
+        if isinstance(response, RoomSendError):
+            self.logger.error(f"Could not post event lag warning: {response.message}")
+
+    def _collect_metrics(self):
+        self._percentile_metric.clear()
+        for stage in EventLagStage:
+            for p, value in self.percentiles(stage).items():
+                self._percentile_metric.set(value, stage=stage.value, percentile=str(p))
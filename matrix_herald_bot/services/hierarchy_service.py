@@ -0,0 +1,52 @@
+from injector import inject, singleton
+from nio import SpaceGetHierarchyError
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+
+# rooms per /hierarchy page, servers may return less
+HIERARCHY_PAGE_SIZE = 100
+
+@singleton
+class MatrixHierarchyService:
+    """Reads whole spaces through the paginated /hierarchy endpoint."""
+
+    @inject
+    def __init__(self, scheduler: MatrixRequestScheduler, logger: MatrixLogger):
+        self.scheduler = scheduler
+        self.logger = logger
+
+    async def get_space_hierarchy(self, space_id: str) -> dict[str, dict]|SpaceGetHierarchyError:
+        """
+        Return the hierarchy room chunks of the space (itself included) by room id.
+
+        Rooms the server can not see are missing from the result.
+        """
+        rooms: dict[str, dict] = {}
+        from_page = None
+        pages = 0
+
+        while True:
+            response = await self.scheduler.request(
+                "space_get_hierarchy",
+                lambda c, page=from_page: c.space_get_hierarchy(
+                    space_id,
+                    from_page=page,
+                    limit=HIERARCHY_PAGE_SIZE
+                )
+            )
+            if isinstance(response, SpaceGetHierarchyError):
+                return response
+
+            pages += 1
+            for room in response.rooms:
+                rooms.setdefault(room["room_id"], room)
+
+            from_page = response.next_batch
+            if not from_page:
+                break
+
+        self.logger.debug(
+            f"Fetched hierarchy of space {space_id}.",
+            extra={"pages": pages, "rooms": len(rooms)}
+        )
+        return rooms
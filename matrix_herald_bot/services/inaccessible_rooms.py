@@ -0,0 +1,103 @@
+import asyncio
+import time
+from injector import inject, singleton
+from nio import RoomGetStateError
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.storage.inaccessible_rooms import InaccessibleRoom, InaccessibleRoomStore
+
+# rate limiting is handled by the scheduler, it says nothing about the room
+UNCACHED_ERROR_CLASSES = ("M_LIMIT_EXCEEDED", "429")
+
+@singleton
+class InaccessibleRoomCache:
+    """
+    Negative cache of rooms whose state could not be read.
+
+    A failing room is retried after NEGATIVE_CACHE_BACKOFF_S, doubling with
+    every further failure of the same error class up to
+    NEGATIVE_CACHE_MAX_BACKOFF_S. A different error class starts over.
+    Entries not refreshed for NEGATIVE_CACHE_TTL_S are dropped.
+    """
+
+    @inject
+    def __init__(
+        self,
+        store: InaccessibleRoomStore,
+        config: Configuration,
+        logger: MatrixLogger
+    ):
+        self.store = store
+        self.config = config
+        self.logger = logger
+        self._rooms: dict[str, InaccessibleRoom] | None = None
+        self._load_lock = asyncio.Lock()
+
+    async def get_blocked(self, room_id: str) -> InaccessibleRoom | None:
+        """The cached failure of the room if it is not due for a retry yet."""
+        room = (await self._load()).get(room_id)
+        if room is None or room.retry_at <= time.time():
+            return None
+        return room
+
+    async def record_failure(self, room_id: str, error: RoomGetStateError):
+        error_class = str(error.status_code or error.message)
+        if error_class in UNCACHED_ERROR_CLASSES:
+            return
+        rooms = await self._load()
+        now = time.time()
+        previous = rooms.get(room_id)
+        if previous is not None and previous.error_class == error_class:
+            failures = previous.failures + 1
+            first_failed_at = previous.first_failed_at
+        else:
+            failures = 1
+            first_failed_at = now
+        backoff = min(
+            self.config.negative_cache_backoff_s * 2 ** (failures - 1),
+            self.config.negative_cache_max_backoff_s
+        )
+        room = InaccessibleRoom(
+            room_id,
+            error_class,
+            error.message,
+            failures,
+            first_failed_at,
+            now,
+            now + backoff
+        )
+        rooms[room_id] = room
+        await self.store.save(room)
+
+    async def record_success(self, room_id: str):
+        rooms = await self._load()
+        if rooms.pop(room_id, None) is not None:
+            self.logger.info(f"Room {room_id} is accessible again.")
+            await self.store.delete([room_id])
+
+    async def entries(self) -> list[InaccessibleRoom]:
+        return list((await self._load()).values())
+
+    async def purge(self, room_ids: list[str] | None = None) -> int:
+        """Forget the given rooms (all without room_ids), so the next crawl retries them."""
+        rooms = await self._load()
+        purged = list(rooms) if room_ids is None else [r for r in room_ids if r in rooms]
+        for room_id in purged:
+            del rooms[room_id]
+        await self.store.delete(None if room_ids is None else purged)
+        return len(purged)
+
+    async def _load(self) -> dict[str, InaccessibleRoom]:
+        async with self._load_lock:
+            if self._rooms is None:
+                expired_before = time.time() - self.config.negative_cache_ttl_s
+                rooms = await self.store.load()
+                expired = [r.room_id for r in rooms if r.last_failed_at < expired_before]
+                if expired:
+                    await self.store.delete(expired)
+                self._rooms = {
+                    room.room_id: room
+                    for room in rooms
+                    if room.last_failed_at >= expired_before
+                }
+            return self._rooms
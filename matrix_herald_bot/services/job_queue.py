@@ -0,0 +1,205 @@
+import asyncio
+import time
+import uuid
+from collections import Counter, deque
+from collections.abc import Awaitable, Callable
+from injector import inject, singleton
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.core.logging.loggers import CoreLogger
+from matrix_herald_bot.model.enums import AdminCommandStatus, JobKind, JobStatus
+from matrix_herald_bot.model.exceptions import JobFailedError
+from matrix_herald_bot.services.admin_service import TuwunelAdminService
+from matrix_herald_bot.storage.jobs import Job, JobResult, JobStore
+
+# how often run_batch checks whether its batch is drained
+BATCH_POLL_INTERVAL_S = 0.5
+
+def promote_job(user_id: str, room_id: str) -> Job:
+    return Job(
+        f"promote:{user_id}:{room_id}",
+        JobKind.PROMOTE,
+        {"user_id": user_id, "room_id": room_id}
+    )
+
+def widget_push_job(tree_root: str, room_id: str) -> Job:
+    return Job(
+        f"widget_push:{room_id}",
+        JobKind.WIDGET_PUSH,
+        {"tree_root": tree_root, "room_id": room_id}
+    )
+
+@singleton
+class MatrixJobQueue:
+    """
+    Runs the durable jobs of the JobStore with a pool of workers.
+
+    Jobs are claimed by priority (widget pushes before promotions). Handlers
+    raise JobFailedError on failure; retryable failures and unexpected
+    exceptions are retried until the job runs out of attempts. Jobs left
+    over by a previous run are resumed by start().
+    """
+
+    @inject
+    def __init__(
+        self,
+        job_store: JobStore,
+        admin_service: TuwunelAdminService,
+        config: Configuration,
+        logger: CoreLogger
+    ):
+        self.job_store = job_store
+        self.admin_service = admin_service
+        self.config = config
+        self.logger = logger
+        # done / failed / retried jobs since start
+        self.stats: Counter[str] = Counter()
+        self._handlers: dict[JobKind, Callable[[dict], Awaitable[None]]] = {
+            JobKind.PROMOTE: self._promote,
+        }
+        self._started = False
+        self._workers: list[asyncio.Task] = []
+        self._progress: asyncio.Task | None = None
+        self._ready: deque[Job] = deque()
+        self._claim_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def register(self, kind: JobKind, handler: Callable[[dict], Awaitable[None]]):
+        self._handlers[kind] = handler
+
+    async def start(self):
+        """Resume the jobs left over by a previous run and start the workers."""
+        if self._started:
+            return
+        self._started = True
+        resumed = await self.job_store.requeue_running()
+        purged = await self.job_store.purge_finished(self.config.job_retention_s)
+        pending = (await self.job_store.counts())[JobStatus.PENDING]
+        self.logger.info(
+            "Job queue started.",
+            extra={"pending": pending, "resumed": resumed, "purged": purged}
+        )
+        self._ensure_workers()
+        self._wakeup.set()
+
+    async def enqueue(self, jobs: list[Job], requeue_done: bool = False) -> int:
+        """Add the jobs (see JobStore.enqueue) and wake up the workers."""
+        if not jobs:
+            return 0
+        queued = await self.job_store.enqueue(jobs, requeue_done)
+        self._ensure_workers()
+        self._wakeup.set()
+        return queued
+
+    async def run_batch(self, jobs: list[Job], requeue_done: bool = False) -> list[JobResult]:
+        """Enqueue the jobs as one batch and wait until all of them finished."""
+        if not jobs:
+            return []
+        batch = self.new_batch()
+        for job in jobs:
+            job.batch = batch
+        await self.enqueue(jobs, requeue_done)
+        return await self.wait_for_batch(batch)
+
+    @staticmethod
+    def new_batch() -> str:
+        """Id to group jobs which are enqueued bit by bit and waited for together."""
+        return uuid.uuid4().hex
+
+    async def wait_for_batch(self, batch: str) -> list[JobResult]:
+        """Wait until no job of the batch is pending or running and return the results."""
+        while True:
+            counts = await self.job_store.counts(batch)
+            if not counts[JobStatus.PENDING] and not counts[JobStatus.RUNNING]:
+                return await self.job_store.results(batch)
+            await asyncio.sleep(BATCH_POLL_INTERVAL_S)
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._work())
+            for _ in range(self.config.job_workers)
+        ]
+        self._progress = asyncio.create_task(self._log_progress())
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._next_job()
+                await self._run(job)
+            except Exception: # pylint: disable=broad-exception-caught
+                self.logger.exception("Job queue worker failed.")
+                await asyncio.sleep(1)
+
+    async def _next_job(self) -> Job:
+        while True:
+            if self._ready:
+                return self._ready.popleft()
+            async with self._claim_lock:
+                if self._ready:
+                    continue
+                self._wakeup.clear()
+                # claim only what the workers can start right away, so newly
+                # queued widget pushes do not wait behind a prefetched backlog
+                jobs = await self.job_store.claim(self.config.job_workers)
+                if jobs:
+                    self._ready.extend(jobs)
+                    continue
+            await self._wakeup.wait()
+
+    async def _run(self, job: Job):
+        handler = self._handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise JobFailedError(f"No handler for {job.kind.value} jobs.")
+            await handler(job.payload)
+        except Exception as e: # pylint: disable=broad-exception-caught
+            retryable = e.retryable if isinstance(e, JobFailedError) else True
+            if not isinstance(e, JobFailedError):
+                self.logger.exception(f"Job {job.key} raised.")
+            if retryable and job.attempts < self.config.job_max_attempts:
+                self.stats["retried"] += 1
+                await self.job_store.finish(job, JobStatus.PENDING, str(e))
+                self._wakeup.set()
+            else:
+                self.stats["failed"] += 1
+                self.logger.warning(f"Job {job.key} failed: {e}")
+                await self.job_store.finish(job, JobStatus.FAILED, str(e))
+            return
+        self.stats["done"] += 1
+        await self.job_store.finish(job, JobStatus.DONE)
+
+    async def _log_progress(self):
+        finished = 0
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.config.job_progress_interval_s)
+            counts = await self.job_store.counts()
+            now = time.monotonic()
+            total_finished = self.stats["done"] + self.stats["failed"]
+            rate = (total_finished - finished) / (now - last)
+            outstanding = counts[JobStatus.PENDING] + counts[JobStatus.RUNNING]
+            if total_finished != finished or outstanding:
+                self.logger.info(
+                    "Job queue progress.",
+                    extra={
+                        "pending": counts[JobStatus.PENDING],
+                        "running": counts[JobStatus.RUNNING],
+                        "done": self.stats["done"],
+                        "failed": self.stats["failed"],
+                        "retried": self.stats["retried"],
+                        "jobs_per_s": round(rate, 2),
+                        "completion": round(
+                            total_finished / (total_finished + outstanding), 3
+                        ) if total_finished + outstanding else 1.0,
+                        "eta_s": round(outstanding / rate) if rate else None,
+                    })
+            finished = total_finished
+            last = now
+
+    async def _promote(self, payload: dict):
+        result = await self.admin_service.force_promote(payload["user_id"], payload["room_id"])
+        if not result.ok:
+            # the admin bot refused: retrying would not change its mind
+            retryable = result.status != AdminCommandStatus.FAILED
+            raise JobFailedError(f"{result.status.value}: {result.error}", retryable)
@@ -1,15 +1,29 @@
 import sys
 import inspect
 from injector import Injector, Module, inject, multiprovider, singleton
-from nio import Event, MatrixRoom, RoomSpaceChildEvent, UnknownEvent
+from nio import (
+    Event,
+    MatrixRoom,
+    RoomMemberEvent,
+    RoomMessageFormatted,
+    RoomSpaceChildEvent,
+    UnknownEvent
+)
 from matrix_herald_bot.config.model import Configuration
 from matrix_herald_bot.core.event.bus import EventBus
 from matrix_herald_bot.core.event.events import TreeStructureUpdated
+from matrix_herald_bot.connection.scheduler import request_priority
 from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.model.enums import RequestPriority
+from matrix_herald_bot.model.exceptions import RequestShedError
 from matrix_herald_bot.services.action_service import MatrixActionService
+from matrix_herald_bot.services.admin_service import TuwunelAdminService
+from matrix_herald_bot.services.announcement_members import AnnouncementRoomMembers
+from matrix_herald_bot.services.job_queue import MatrixJobQueue, promote_job
+from matrix_herald_bot.services.promotion_planner import MatrixPromotionPlanner
 from matrix_herald_bot.services.tree_cache import MatrixTreeCache
 from matrix_herald_bot.services.tree_operations import MatrixTreeOperations
-from matrix_herald_bot.services.tree_builder import MatrixTreeBuilder
+from matrix_herald_bot.services.tree_reconciler import MatrixTreeReconciler
 
 class ListenerInterface[T: Event]:
     def getEventType(self) -> type[T]:
@@ -18,6 +32,21 @@ class ListenerInterface[T: Event]:
     async def onEvent(self, room: MatrixRoom, event: T):
         raise NotImplementedError
 
+    def getSyncEventTypes(self) -> list[str] | None:
+        """Matrix event types the listener needs, None for all."""
+        return None
+
+    def getSyncRooms(self) -> list[str] | None:
+        """
+        Rooms the listener needs events of, None for all. Events of listeners
+        which name their rooms are fetched per room instead of by the sync.
+        """
+        return None
+
+    def getDispatchKey(self, _room: MatrixRoom, _event: T) -> str | None:
+        """Events with the same key are handled in order, None for no ordering."""
+        return None
+
 @singleton
 class UpdateWatchedTreeOnSpaceChildAdded(ListenerInterface[RoomSpaceChildEvent]):
     @inject
@@ -28,7 +57,8 @@ class UpdateWatchedTreeOnSpaceChildAdded(ListenerInterface[RoomSpaceChildEvent])
         config: Configuration,
         event_bus: EventBus,
         logger: MatrixLogger,
-        action_service: MatrixActionService
+        action_service: MatrixActionService,
+        tree_reconciler: MatrixTreeReconciler
     ):
         self.tree_cache = tree_cache
         self.tree_operations = tree_operations
@@ -36,10 +66,18 @@ class UpdateWatchedTreeOnSpaceChildAdded(ListenerInterface[RoomSpaceChildEvent])
         self.event_bus = event_bus
         self.logger = logger
         self.action_service = action_service
+        self.tree_reconciler = tree_reconciler
 
     def getEventType(self) -> type[RoomSpaceChildEvent]:
         return RoomSpaceChildEvent
 
+    def getSyncEventTypes(self) -> list[str] | None:
+        return ["m.space.child"]
+
+    def getDispatchKey(self, _room: MatrixRoom, _event: RoomSpaceChildEvent) -> str | None:
+        # all changes of the watched space apply to the same tree
+        return self.config.watched_space
+
     async def onEvent(self, room: MatrixRoom, event: RoomSpaceChildEvent):
         parent_id = room.room_id
         # The via-fiel in content idicates if the room was added or removed from
@@ -50,38 +88,47 @@ class UpdateWatchedTreeOnSpaceChildAdded(ListenerInterface[RoomSpaceChildEvent])
         if (watched_space := self.config.watched_space) not in self.tree_cache:
             await self._initializeRoomTree(watched_space)
         elif room_is_added:
-            await self._onRoomAdded(watched_space, space_child, parent_id)
+            await self._onRoomAdded(
+                watched_space,
+                space_child,
+                parent_id,
+                event.server_timestamp
+            )
         else:
             await self._onRoomRemoved(watched_space, space_child, parent_id)
 
     async def _initializeRoomTree(self, watched_space: str):
         self.logger.info("Initializing room tree.")
-        tree = (await self.tree_operations
-                          .fetch_tree_and_join_on_all_public_nodes(watched_space))
-        self.tree_cache[watched_space] = tree
-        await self.event_bus.publish(TreeStructureUpdated(tree))
+        await self.tree_reconciler.refresh(watched_space)
 
     async def _onRoomAdded(
         self,
         watched_space: str,
         new_room_id: str,
-        parent_id: str
+        parent_id: str,
+        origin_server_ts: int
     ):
-        tree = self.tree_cache[watched_space]
-        known_rooms = tree.child_ids
-        if parent_id in known_rooms:
+        async with self.tree_cache.lock(watched_space):
+            tree = self.tree_cache[watched_space]
+            if parent_id not in tree:
+                return
             self.logger.info(
                 f"Updating room tree: New room {new_room_id} in watched space."
             )
-            self.logger.debug("Known rooms in cache.", extra={'childs':known_rooms})
+            self.logger.debug("Known rooms in cache.", extra={'known_rooms': len(tree)})
+            # if child exists already in another part of the tree, there is no
+            # need to promote the users in it again
+            already_known = new_room_id in tree
             subtree = (await self.tree_operations
                           .fetch_tree_and_join_on_all_public_nodes(new_room_id))
             tree.add_node(parent_id, subtree.root)
-            # if child exists already in another part of the tree, there is no
-            # need to promote the users in it again
-            if new_room_id not in known_rooms:
+            if not already_known:
                 tree.childs_which_need_user_promotion.extend(subtree.child_ids)
-            await self.event_bus.publish(TreeStructureUpdated(tree))
+            self.tree_cache.touch(watched_space)
+        await self.event_bus.publish(
+            TreeStructureUpdated(tree, origin_server_ts),
+            wait=False
+        )
 
     async def _onRoomRemoved(
         self,
@@ -89,38 +136,134 @@ class UpdateWatchedTreeOnSpaceChildAdded(ListenerInterface[RoomSpaceChildEvent])
         removed_room_id: str,
         parent_id: str
     ):
-        tree = self.tree_cache[watched_space]
-        known_rooms = tree.child_ids
-        if parent_id in known_rooms:
-            self.logger.info(
-                "Updating room tree."
-                f"Room {removed_room_id} was removed from its parent {parent_id}."
-            )
-            tree.remove_node(parent_id, removed_room_id)
+        async with self.tree_cache.lock(watched_space):
+            tree = self.tree_cache[watched_space]
+            if parent_id in tree:
+                self.logger.info(
+                    "Updating room tree."
+                    f"Room {removed_room_id} was removed from its parent {parent_id}."
+                )
+                tree.remove_node(parent_id, removed_room_id)
+                self.tree_cache.touch(watched_space)
+                await self.tree_cache.save(watched_space)
 
 @singleton
 class RespondOnTreeRequest(ListenerInterface[UnknownEvent]):
     @inject
     def __init__(
         self,
-        tree_builder: MatrixTreeBuilder,
+        tree_reconciler: MatrixTreeReconciler,
         tree_operations: MatrixTreeOperations,
         config: Configuration,
         logger: MatrixLogger
     ):
         self.config = config
-        self.tree_builder = tree_builder
+        self.tree_reconciler = tree_reconciler
         self.tree_operations = tree_operations
         self.logger = logger
 
     def getEventType(self) -> type[UnknownEvent]:
         return UnknownEvent
 
+    def getSyncEventTypes(self) -> list[str] | None:
+        return ["org.herald.tree_structure_request"]
+
     async def onEvent(self, room: MatrixRoom, event: UnknownEvent):
         if event.type == 'org.herald.tree_structure_request':
             self.logger.info(f"Room tree requested by widget in room {room.room_id}.")
-            tree = await self.tree_builder.fetch_tree(self.config.watched_space)
-            await self.tree_operations.send_tree_to_room(tree, room.room_id)
+            try:
+                with request_priority(RequestPriority.INTERACTIVE):
+                    tree = await self.tree_reconciler.get_tree(
+                        self.config.watched_space,
+                        self.config.tree_max_staleness_s
+                    )
+                    await self.tree_operations.send_tree_to_room(tree, room.room_id)
+            except RequestShedError as e:
+                self.logger.warning(
+                    f"Dropping tree request of widget in room {room.room_id}: {e}"
+                )
+
+@singleton
+class CorrelateAdminCommandReplies(ListenerInterface[RoomMessageFormatted]):
+    """Hands the admin bot's replies in the admin room to the admin service."""
+
+    @inject
+    def __init__(self, admin_service: TuwunelAdminService, config: Configuration):
+        self.admin_service = admin_service
+        self.config = config
+
+    def getEventType(self) -> type[RoomMessageFormatted]:
+        return RoomMessageFormatted
+
+    def getSyncEventTypes(self) -> list[str] | None:
+        return ["m.room.message"]
+
+    def getSyncRooms(self) -> list[str] | None:
+        return [self.config.admin_room_id]
+
+    async def onEvent(self, room: MatrixRoom, event: RoomMessageFormatted):
+        if room.room_id != self.config.admin_room_id:
+            return
+        if event.sender != self.config.admin_bot_id:
+            return
+        relates_to = event.source.get("content", {}).get("m.relates_to", {})
+        in_reply_to = relates_to.get("m.in_reply_to", {}).get("event_id")
+        self.admin_service.handle_reply(event.body, in_reply_to)
+
+@singleton
+class PromoteUserOnAnnouncementRoomJoin(ListenerInterface[RoomMemberEvent]):
+    """
+    Promotes a user who joins the announcement room in the public rooms of
+    the cached watched tree, without re-crawling it.
+    """
+
+    @inject
+    def __init__(
+        self,
+        announcement_members: AnnouncementRoomMembers,
+        tree_cache: MatrixTreeCache,
+        promotion_planner: MatrixPromotionPlanner,
+        job_queue: MatrixJobQueue,
+        config: Configuration,
+        logger: MatrixLogger
+    ):
+        self.announcement_members = announcement_members
+        self.tree_cache = tree_cache
+        self.promotion_planner = promotion_planner
+        self.job_queue = job_queue
+        self.config = config
+        self.logger = logger
+
+    def getEventType(self) -> type[RoomMemberEvent]:
+        return RoomMemberEvent
+
+    def getSyncEventTypes(self) -> list[str] | None:
+        return ["m.room.member"]
+
+    def getSyncRooms(self) -> list[str] | None:
+        return [self.config.announcement_room]
+
+    async def onEvent(self, room: MatrixRoom, event: RoomMemberEvent):
+        if room.room_id != self.config.announcement_room:
+            return
+        if not self.announcement_members.apply(event):
+            return
+
+        tree = self.tree_cache.get(self.config.watched_space)
+        if tree is None:
+            # no tree crawled yet, so there are no rooms to promote the user in
+            return
+        user_id = event.state_key
+        nodes = tree.get_public_nodes()
+        pairs = await self.promotion_planner.plan([user_id], nodes)
+        queued = await self.job_queue.enqueue(
+            [promote_job(user_id, room_id) for _, room_id in pairs],
+            requeue_done=True
+        )
+        self.logger.info(
+            f"Queued promotion of {user_id} after joining the announcement room.",
+            extra={"rooms": len(nodes), "queued": queued}
+        )
 
 class MatrixListenerCollectionModule(Module):
     @multiprovider
@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from injector import inject, singleton
 from nio import SyncError
 
-from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
 
 @dataclass
 class UnreadRoomNotifications:
@@ -13,11 +13,11 @@ class UnreadRoomNotifications:
 @singleton
 class NotificationService:
     @inject
-    def __init__(self, connection: Connection):
-        self.connection = connection
+    def __init__(self, scheduler: MatrixRequestScheduler):
+        self.scheduler = scheduler
 
     async def get_all_unread_notifications(self) -> SyncError|list[UnreadRoomNotifications]:
-        sync_response = await self.connection.get_client_or_raise().sync(5000)
+        sync_response = await self.scheduler.request("sync", lambda c: c.sync(5000))
 
         if isinstance(sync_response, SyncError):
             return sync_response
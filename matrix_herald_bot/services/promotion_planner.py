@@ -0,0 +1,95 @@
+import asyncio
+from injector import inject, singleton
+from nio import RoomGetStateError
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.model.tree_node import MatrixTreeNode
+from matrix_herald_bot.services.state_service import MatrixStateService
+
+def user_power_level(power_levels: dict, user_id: str) -> int:
+    """Power level of the user according to m.room.power_levels content."""
+    level = power_levels.get("users", {}).get(user_id, power_levels.get("users_default", 0))
+    try:
+        return int(level)
+    except (TypeError, ValueError):
+        return 0
+
+@singleton
+class MatrixPromotionPlanner:
+    """
+    Decides which (user, room) pairs need a force-promote by comparing the
+    desired power level with the room's m.room.power_levels.
+    """
+
+    @inject
+    def __init__(
+        self,
+        state_service: MatrixStateService,
+        config: Configuration,
+        logger: MatrixLogger
+    ):
+        self.state_service = state_service
+        self.config = config
+        self.logger = logger
+
+    async def plan(
+        self,
+        users: list[str],
+        nodes: list[MatrixTreeNode]
+    ) -> list[tuple[str, str]]:
+        """
+        Return the (user, room) pairs below the desired power level, room by
+        room. Power levels not known yet are fetched first.
+        """
+        await asyncio.gather(*(
+            self._fetch_power_levels(node)
+            for node in nodes
+            if node.power_levels is None
+        ))
+
+        pairs = [
+            (user_id, node.id)
+            for node in nodes
+            for user_id in users
+            if not self.has_power(node, user_id)
+        ]
+        self.logger.debug(
+            "Planned promotions.",
+            extra={
+                "planned": len(pairs),
+                "skipped": len(nodes) * len(users) - len(pairs),
+            })
+        return pairs
+
+    def has_power(self, node: MatrixTreeNode, user_id: str) -> bool:
+        if node.power_levels is None:
+            return False
+        return user_power_level(node.power_levels, user_id) >= self.config.promotion_power_level
+
+    def record_promotions(
+        self,
+        nodes: list[MatrixTreeNode],
+        promoted: list[tuple[str, str]]
+    ):
+        """
+        Note successful (user, room) promotions in the nodes, so a rerun
+        before the next crawl does not promote the users again.
+        """
+        by_id = {node.id: node for node in nodes}
+        for user_id, room_id in promoted:
+            node = by_id.get(room_id)
+            if node is None or node.power_levels is None:
+                continue
+            users = {
+                **node.power_levels.get("users", {}),
+                user_id: self.config.promotion_power_level
+            }
+            node.power_levels = {**node.power_levels, "users": users}
+
+    async def _fetch_power_levels(self, node: MatrixTreeNode):
+        event = await self.state_service.get_state_event(node.id, "m.room.power_levels")
+        if isinstance(event, RoomGetStateError):
+            # unknown, the users get promoted to be safe
+            self.logger.debug(f"Could not read power levels of room {node.id}: {event.message}")
+            return
+        node.power_levels = event["content"] if event is not None else {}
@@ -0,0 +1,94 @@
+import asyncio
+from injector import inject, singleton
+from nio import Event, MatrixRoom, MessageDirection, RoomMessagesError
+from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.model.exceptions import RequestShedError
+from matrix_herald_bot.services.event_dispatcher import MatrixEventDispatcher
+from matrix_herald_bot.services.listeners import ListenerInterface
+from matrix_herald_bot.services.sync_filter import build_room_event_filter
+
+# events per /messages page, servers may return less
+ROOM_EVENTS_PAGE_SIZE = 100
+
+@singleton
+class MatrixRoomEventFetcher:
+    """
+    Fetches the events of listeners which only need a few rooms (see
+    ListenerInterface.getSyncRooms) with room scoped /messages requests, so
+    their event types do not widen the sync filter of every joined room.
+
+    After each sync the events of those rooms between the previous and the
+    new sync token are fetched and handed to the dispatcher, before the new
+    token is stored.
+    """
+
+    @inject
+    def __init__(
+        self,
+        listeners: list[ListenerInterface],
+        dispatcher: MatrixEventDispatcher,
+        scheduler: MatrixRequestScheduler,
+        connection: Connection,
+        logger: MatrixLogger
+    ):
+        self.dispatcher = dispatcher
+        self.scheduler = scheduler
+        self.connection = connection
+        self.logger = logger
+        # room id -> listeners which need the events of the room
+        self._rooms: dict[str, list[ListenerInterface]] = {}
+        for listener in listeners:
+            for room_id in listener.getSyncRooms() or []:
+                self._rooms.setdefault(room_id, []).append(listener)
+
+    async def fetch(self, since: str, until: str):
+        """Hand the events between the two sync tokens to the listeners."""
+        await asyncio.gather(*(
+            self._fetch_room(room_id, listeners, since, until)
+            for room_id, listeners in self._rooms.items()
+        ))
+
+    async def _fetch_room(
+        self,
+        room_id: str,
+        listeners: list[ListenerInterface],
+        since: str,
+        until: str
+    ):
+        client = self.connection.get_client_or_raise()
+        message_filter = build_room_event_filter(listeners)
+        room = client.rooms.get(room_id) or MatrixRoom(room_id, client.user_id)
+        start = since
+
+        while True:
+            try:
+                response = await self.scheduler.request(
+                    "room_messages",
+                    lambda c, page=start: c.room_messages(
+                        room_id,
+                        start=page,
+                        end=until,
+                        direction=MessageDirection.front,
+                        limit=ROOM_EVENTS_PAGE_SIZE,
+                        message_filter=message_filter
+                    )
+                )
+            except RequestShedError as e:
+                self.logger.error(f"Could not fetch the events of room {room_id}: {e}")
+                return
+            if isinstance(response, RoomMessagesError):
+                self.logger.error(
+                    f"Could not fetch the events of room {room_id}: {response.message}"
+                )
+                return
+
+            for event in response.chunk:
+                # events nio could not parse are dropped, as in the sync
+                if isinstance(event, Event):
+                    self.dispatcher.receive(room, event, listeners)
+
+            if not response.chunk or not response.end or response.end == start:
+                return
+            start = response.end
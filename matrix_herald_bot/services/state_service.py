@@ -0,0 +1,152 @@
+import asyncio
+from injector import inject, singleton
+from nio import JoinedMembersError, RoomGetStateError, RoomGetStateEventError
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.connection.connection import Connection
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+
+HERALD_WIDGET_EVENT_TYPE = "org.herald.tree_structure_request"
+HERALD_WIDGET_STATE_KEY = "herald_widget"
+
+# (type, state_key) of the single state events a tree node is built from,
+# besides m.room.create and the m.space.child events of spaces
+TREE_STATE_EVENTS: tuple[tuple[str, str], ...] = (
+    ("m.room.name", ""),
+    ("m.room.canonical_alias", ""),
+    ("m.room.join_rules", ""),
+    ("m.room.power_levels", ""),
+    (HERALD_WIDGET_EVENT_TYPE, HERALD_WIDGET_STATE_KEY),
+)
+
+TREE_STATE_TYPES: tuple[str, ...] = (
+    "m.room.create",
+    "m.space.child",
+    *(event_type for event_type, _ in TREE_STATE_EVENTS),
+)
+
+_TREE_STATE_KEYS = dict(TREE_STATE_EVENTS)
+
+def _is_tree_state_event(event: dict) -> bool:
+    event_type = event["type"]
+    if event_type in _TREE_STATE_KEYS:
+        return event.get("state_key") == _TREE_STATE_KEYS[event_type]
+    return event_type in TREE_STATE_TYPES
+
+@singleton
+class MatrixStateService:
+    """
+    Fetches only the room state a caller needs instead of full /state dumps,
+    which in large rooms consist mostly of m.room.member events.
+    """
+
+    @inject
+    def __init__(
+        self,
+        scheduler: MatrixRequestScheduler,
+        connection: Connection,
+        config: Configuration
+    ):
+        self.scheduler = scheduler
+        self.connection = connection
+        self.config = config
+
+    async def get_state_event(
+        self,
+        room_id: str,
+        event_type: str,
+        state_key: str = ""
+    ) -> dict|None|RoomGetStateError:
+        """Return a single state event, None if the room does not have it."""
+        response = await self.scheduler.request(
+            "room_get_state_event",
+            lambda c: c.room_get_state_event(room_id, event_type, state_key)
+        )
+
+        if isinstance(response, RoomGetStateEventError):
+            if response.status_code == "M_NOT_FOUND":
+                return None
+            return RoomGetStateError(
+                response.message,
+                response.status_code,
+                response.retry_after_ms,
+                response.soft_logout,
+                room_id
+            )
+
+        return {
+            "type": event_type,
+            "state_key": state_key,
+            "content": response.content
+        }
+
+    async def get_state_events(
+        self,
+        room_id: str,
+        keys: tuple[tuple[str, str], ...]
+    ) -> list[dict]|RoomGetStateError:
+        """Fetch the given (type, state_key) pairs in parallel, skipping missing ones."""
+        responses = await asyncio.gather(*(
+            self.get_state_event(room_id, event_type, state_key)
+            for event_type, state_key in keys
+        ))
+
+        events = []
+        for response in responses:
+            if isinstance(response, RoomGetStateError):
+                return response
+            if response is not None:
+                events.append(response)
+        return events
+
+    async def get_tree_state(self, room_id: str) -> list[dict]|RoomGetStateError:
+        """
+        Return the state events a tree node is built from.
+
+        Rooms are read with a single /state request, unless they are known to
+        have so many members that their state is mostly m.room.member events.
+        Those are read with targeted requests, except for spaces, because the
+        state keys of their m.space.child events are not known in advance.
+        """
+        if not self._has_large_state(room_id):
+            return await self._get_filtered_state(room_id)
+
+        create = await self.get_state_event(room_id, "m.room.create")
+        if isinstance(create, RoomGetStateError):
+            return create
+
+        if create is not None and create["content"].get("type") == "m.space":
+            return await self._get_filtered_state(room_id)
+
+        events = await self.get_state_events(room_id, TREE_STATE_EVENTS)
+        if isinstance(events, RoomGetStateError):
+            return events
+        return [create, *events] if create is not None else events
+
+    def _has_large_state(self, room_id: str) -> bool:
+        # the member count is only known for rooms the sync told us about
+        client = self.connection.get_client()
+        room = client.rooms.get(room_id) if client is not None else None
+        return (
+            room is not None
+            and room.joined_count >= self.config.state_targeted_fetch_min_members
+        )
+
+    async def _get_filtered_state(self, room_id: str) -> list[dict]|RoomGetStateError:
+        state = await self.scheduler.request(
+            "room_get_state",
+            lambda c: c.room_get_state(room_id)
+        )
+        if isinstance(state, RoomGetStateError):
+            return state
+        return [ev for ev in state.events if _is_tree_state_event(ev)]
+
+    async def get_joined_members(self, room_id: str) -> list[str]|JoinedMembersError:
+        response = await self.scheduler.request(
+            "joined_members",
+            lambda c: c.joined_members(room_id)
+        )
+
+        if isinstance(response, JoinedMembersError):
+            return response
+
+        return [member.user_id for member in response.members]
@@ -0,0 +1,53 @@
+from matrix_herald_bot.services.listeners import ListenerInterface
+
+def build_sync_filter(listeners: list[ListenerInterface]) -> dict:
+    """
+    Build a sync filter definition which only lets through what the listeners
+    declared they consume. Presence, account data and ephemeral events are
+    not consumed by any listener and always filtered out.
+
+    A sync filter applies the same event types to every room, so listeners
+    which only need a few rooms (see getSyncRooms) are left out; their events
+    are fetched per room by MatrixRoomEventFetcher.
+    """
+    event_types: set[str] | None = set()
+    for listener in listeners:
+        if listener.getSyncRooms() is not None:
+            continue
+        listener_types = listener.getSyncEventTypes()
+        if listener_types is None or event_types is None:
+            event_types = None
+        else:
+            event_types.update(listener_types)
+
+    room_event_filter: dict = {"lazy_load_members": True}
+    if event_types is not None:
+        room_event_filter["types"] = sorted(event_types)
+
+    return {
+        "presence": {"types": []},
+        "account_data": {"types": []},
+        "room": {
+            "timeline": dict(room_event_filter),
+            "state": dict(room_event_filter),
+            "ephemeral": {"types": []},
+            "account_data": {"types": []},
+        },
+    }
+
+def build_room_event_filter(listeners: list[ListenerInterface]) -> dict:
+    """Room event filter for the /messages requests of room scoped listeners."""
+    event_types: set[str] | None = set()
+    for listener in listeners:
+        listener_types = listener.getSyncEventTypes()
+        if listener_types is None or event_types is None:
+            event_types = None
+        else:
+            event_types.update(listener_types)
+    return {} if event_types is None else {"types": sorted(event_types)}
+
+def build_first_sync_filter(listeners: list[ListenerInterface]) -> dict:
+    """The sync filter without timeline events, for syncing from scratch."""
+    definition = build_sync_filter(listeners)
+    definition["room"]["timeline"]["limit"] = 0
+    return definition
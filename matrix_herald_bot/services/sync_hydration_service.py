@@ -0,0 +1,83 @@
+import time
+from injector import inject, singleton
+from nio import AsyncClient, SyncError
+from nio.api import Api
+from matrix_herald_bot.connection.scheduler import MatrixRequestScheduler
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.services.state_service import TREE_STATE_TYPES
+
+# current tree state of every joined room, and nothing else
+HYDRATION_FILTER = {
+    "presence": {"types": []},
+    "account_data": {"types": []},
+    "room": {
+        "state": {"types": list(TREE_STATE_TYPES), "lazy_load_members": True},
+        "timeline": {"limit": 0},
+        "ephemeral": {"types": []},
+        "account_data": {"types": []},
+        "include_leave": False,
+    },
+}
+
+@singleton
+class MatrixSyncHydrationService:
+    """
+    Reads the tree state of all joined rooms with a single filtered full
+    state sync.
+
+    The sync is sent raw, past the client's sync handling: neither the
+    client's next_batch nor the event callbacks of the sync loop see it.
+    """
+
+    @inject
+    def __init__(self, scheduler: MatrixRequestScheduler, logger: MatrixLogger):
+        self.scheduler = scheduler
+        self.logger = logger
+
+    async def get_joined_room_states(self) -> dict[str, list[dict]]|SyncError:
+        """Return the tree state events of every joined room by room id."""
+        started = time.monotonic()
+        response = await self.scheduler.request("sync_hydration", self._sync)
+        if isinstance(response, SyncError):
+            return response
+
+        states = {
+            room_id: [
+                event for event in room.get("state", {}).get("events", [])
+                if event.get("type") in TREE_STATE_TYPES and "state_key" in event
+            ]
+            for room_id, room in response.get("rooms", {}).get("join", {}).items()
+        }
+        self.logger.debug(
+            "Hydrated room states from sync.",
+            extra={
+                "rooms": len(states),
+                "events": sum(len(events) for events in states.values()),
+                "duration_s": round(time.monotonic() - started, 3),
+            })
+        return states
+
+    @staticmethod
+    async def _sync(client: AsyncClient) -> dict|SyncError:
+        method, path = Api.sync(
+            client.access_token,
+            timeout=0,
+            filter=HYDRATION_FILTER,
+            full_state=True,
+            set_presence="offline"
+        )
+        response = await client.send(method, path)
+        try:
+            body = await response.json(content_type=None)
+        except ValueError:
+            body = None
+        finally:
+            response.release()
+        if response.status != 200 and isinstance(body, dict) and "errcode" in body:
+            return SyncError(body.get("error", "unknown error"), body["errcode"])
+        if response.status != 200 or not isinstance(body, dict):
+            return SyncError(
+                f"Sync failed with HTTP status {response.status}.",
+                str(response.status)
+            )
+        return body
@@ -1,13 +1,103 @@
+import asyncio
 from collections.abc import Awaitable, Callable
+from dataclasses import replace
 from typing import Any
 from injector import inject, singleton
-from nio import RoomGetStateError
+from nio import RoomGetStateError, SpaceGetHierarchyError, SyncError
 from matrix_herald_bot.config.model import Configuration
 from matrix_herald_bot.connection.connection import Connection
 from matrix_herald_bot.core.logging.loggers import MatrixLogger, MatrixTreeLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
 from matrix_herald_bot.model.tree import MatrixTree
 from matrix_herald_bot.model.enums import MatrixNodeType
 from matrix_herald_bot.model.tree_node import MatrixTreeNode
+from matrix_herald_bot.services.hierarchy_service import MatrixHierarchyService
+from matrix_herald_bot.services.inaccessible_rooms import InaccessibleRoomCache
+from matrix_herald_bot.services.state_service import (
+    HERALD_WIDGET_EVENT_TYPE,
+    HERALD_WIDGET_STATE_KEY,
+    MatrixStateService
+)
+from matrix_herald_bot.services.sync_hydration_service import MatrixSyncHydrationService
+
+class _TreeCrawl:
+    """
+    State of a single fetch_tree call.
+
+    Every room is fetched (and joined) at most once per crawl, no matter how
+    many parents list it. Nodes are still built per path, so a room shared by
+    two spaces shows up below both, while a child pointing back to one of its
+    ancestors is recorded in cyclic_childs instead of being recursed into.
+    """
+
+    def __init__(
+        self,
+        fetch_room: Callable[[str], Awaitable[tuple[MatrixTreeNode, list[str]]]],
+        concurrency: int,
+        on_room: Callable[[MatrixTreeNode], Any]|None = None
+    ):
+        self.fetch_room = fetch_room
+        # called with the node (without childs) of every room once it is fetched
+        self.on_room = on_room
+        # every crawl gets its own cap, so parallel crawls do not starve each other
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rooms: dict[str, asyncio.Task[tuple[MatrixTreeNode, list[str]]]] = {}
+        self.duplicate_references = 0
+        self.cycles = 0
+
+    async def build_node(
+        self,
+        room_id: str,
+        ancestors: frozenset[str] = frozenset()
+    ) -> MatrixTreeNode:
+        template, child_ids = await self._fetch_room_once(room_id)
+        node = replace(template, childs=[], cyclic_childs=[])
+
+        path = ancestors | {room_id}
+        for child_id in child_ids:
+            if child_id in path:
+                node.cyclic_childs.append(child_id)
+                self.cycles += 1
+
+        # gather keeps the order of the m.space.child events
+        node.childs = list(await asyncio.gather(*(
+            self.build_node(child_id, path)
+            for child_id in child_ids
+            if child_id not in path
+        )))
+        return node
+
+    def cancel(self):
+        for task in self.rooms.values():
+            task.cancel()
+
+    def statistics(self) -> dict[str, int]:
+        return {
+            "unique_rooms": len(self.rooms),
+            "duplicate_references": self.duplicate_references,
+            "cycles": self.cycles,
+        }
+
+    def _fetch_room_once(
+        self,
+        room_id: str
+    ) -> asyncio.Task[tuple[MatrixTreeNode, list[str]]]:
+        task = self.rooms.get(room_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_room_limited(room_id))
+            self.rooms[room_id] = task
+        else:
+            self.duplicate_references += 1
+        return task
+
+    async def _fetch_room_limited(self, room_id: str) -> tuple[MatrixTreeNode, list[str]]:
+        # Only the homeserver round trips hold a slot. Waiting for the childs
+        # must not, otherwise a tree deeper than the cap would deadlock.
+        async with self.semaphore:
+            result = await self.fetch_room(room_id)
+        if self.on_room is not None:
+            self.on_room(result[0])
+        return result
 
 @singleton
 class MatrixTreeBuilder:
@@ -17,19 +107,81 @@ class MatrixTreeBuilder:
         connection: Connection,
         logger: MatrixLogger,
         tree_logger: MatrixTreeLogger,
-        config: Configuration
+        config: Configuration,
+        hierarchy_service: MatrixHierarchyService,
+        state_service: MatrixStateService,
+        inaccessible_rooms: InaccessibleRoomCache,
+        sync_hydration_service: MatrixSyncHydrationService,
+        metrics: MetricsRegistry
     ):
         self.config = config
+        self.inaccessible_rooms = inaccessible_rooms
+        self.sync_hydration_service = sync_hydration_service
+        self.hierarchy_service = hierarchy_service
+        self.state_service = state_service
         self.logger = logger
         self.connection = connection
         self.tree_logger = tree_logger
+        self._crawl_duration = metrics.histogram(
+            "herald_tree_crawl_duration_seconds",
+            "Duration of finished tree crawls by crawl backend.",
+            ("backend",)
+        )
+        self._crawl_rooms = metrics.histogram(
+            "herald_tree_crawl_rooms",
+            "Rooms fetched per finished tree crawl by crawl backend.",
+            ("backend",),
+            buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+        )
 
     async def fetch_tree(
         self,
         room_id: str,
-        preexec: Callable[[str], Awaitable[Any]]|None = None
+        preexec: Callable[[str], Awaitable[Any]]|None = None,
+        rooms: asyncio.Queue[MatrixTreeNode|None]|None = None
     ) -> MatrixTree:
-        tree = MatrixTree(await self._fetch_tree_node(room_id, preexec))
+        """
+        Crawl the tree below room_id.
+
+        With a rooms queue, the node (without childs) of every room is put
+        into it as soon as the room is fetched, each room once, followed by
+        None when the crawl ended. This lets consumers work on the rooms
+        while the crawl is still running.
+        """
+        negative_cache_hits: list[str] = []
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            crawl = _TreeCrawl(
+                self._with_negative_cache(
+                    await self._room_fetcher(room_id, preexec),
+                    negative_cache_hits
+                ),
+                self.config.crawl_concurrency,
+                rooms.put_nowait if rooms is not None else None
+            )
+            try:
+                tree = MatrixTree(await crawl.build_node(room_id))
+            finally:
+                # stops fetches still in flight if the crawl failed
+                crawl.cancel()
+        finally:
+            if rooms is not None:
+                rooms.put_nowait(None)
+
+        backend = self.config.crawl_backend
+        statistics = crawl.statistics()
+        self._crawl_duration.observe(loop.time() - started, backend=backend)
+        self._crawl_rooms.observe(statistics["unique_rooms"], backend=backend)
+        self.tree_logger.info(
+            "Crawl statistics.",
+            extra={
+                'room_id': room_id,
+                'backend': backend,
+                **statistics,
+                'negative_cache_hits': len(negative_cache_hits),
+            }
+        )
         if self.config.env == 'dev':
             self.tree_logger.debug(
                 "Matrix Tree.",
@@ -37,33 +189,179 @@ class MatrixTreeBuilder:
             )
         return tree
 
-    async def _fetch_tree_node(
+    async def _room_fetcher(
+        self,
+        room_id: str,
+        preexec: Callable[[str], Awaitable[Any]]|None
+    ) -> Callable[[str], Awaitable[tuple[MatrixTreeNode, list[str]]]]:
+        """Return the function the crawl uses to fetch a single room."""
+        # The sync returns all joined rooms, which only pays off for the whole
+        # watched space. Subtrees of new rooms are fetched room by room.
+        if self.config.crawl_backend == "sync" and room_id == self.config.watched_space:
+            states = await self.sync_hydration_service.get_joined_room_states()
+            if not isinstance(states, SyncError):
+                return lambda child_id: self._fetch_room_from_sync(child_id, states, preexec)
+            self.logger.warning(
+                f"Could not hydrate room states from sync, falling back to room states: "
+                f"{states.message}"
+            )
+
+        if self.config.crawl_backend == "hierarchy":
+            hierarchy = await self.hierarchy_service.get_space_hierarchy(room_id)
+            if not isinstance(hierarchy, SpaceGetHierarchyError):
+                return lambda child_id: self._fetch_room_from_hierarchy(
+                    child_id,
+                    hierarchy,
+                    preexec
+                )
+            self.logger.warning(
+                f"Could not fetch hierarchy of {room_id}, falling back to room states: "
+                f"{hierarchy.message}"
+            )
+
+        return lambda child_id: self._fetch_room(child_id, preexec)
+
+    def _with_negative_cache(
+        self,
+        fetch_room: Callable[[str], Awaitable[tuple[MatrixTreeNode, list[str]]]],
+        hits: list[str]
+    ) -> Callable[[str], Awaitable[tuple[MatrixTreeNode, list[str]]]]:
+        """
+        Reuse the last error of rooms which are backing off instead of
+        fetching (and joining) them again, and keep the cache up to date.
+        """
+        async def fetch(room_id: str) -> tuple[MatrixTreeNode, list[str]]:
+            blocked = await self.inaccessible_rooms.get_blocked(room_id)
+            if blocked is not None:
+                hits.append(room_id)
+                return self._node_from_state_events(
+                    room_id,
+                    RoomGetStateError(blocked.message, blocked.error_class)
+                )
+
+            node, child_ids = await fetch_room(room_id)
+            if node.error is not None:
+                await self.inaccessible_rooms.record_failure(room_id, node.error)
+            else:
+                await self.inaccessible_rooms.record_success(room_id)
+            return node, child_ids
+
+        return fetch
+
+    async def _fetch_room(
         self,
         room_id: str,
         preexec: Callable[[str], Awaitable[Any]]|None = None
-    ) -> MatrixTreeNode:
-        client = self.connection.get_client_or_raise()
+    ) -> tuple[MatrixTreeNode, list[str]]:
+        """Fetch a single room and return its node (without childs) and child ids."""
+        if preexec is not None:
+            await preexec(room_id)
+
+        state_events = await self.state_service.get_tree_state(room_id)
+        return self._node_from_state_events(room_id, state_events)
+
+    async def _fetch_room_from_sync(
+        self,
+        room_id: str,
+        states: dict[str, list[dict]],
+        preexec: Callable[[str], Awaitable[Any]]|None = None
+    ) -> tuple[MatrixTreeNode, list[str]]:
+        """Build a joined room from its synced state, fetch the others."""
+        events = states.get(room_id)
+        if events is None:
+            return await self._fetch_room(room_id, preexec)
+        return self._node_from_state_events(room_id, events)
+
+    async def _fetch_room_from_hierarchy(
+        self,
+        room_id: str,
+        hierarchy: dict[str, dict],
+        preexec: Callable[[str], Awaitable[Any]]|None = None
+    ) -> tuple[MatrixTreeNode, list[str]]:
+        """
+        Build a room from its /hierarchy chunk. Only the herald widget state,
+        which the hierarchy does not carry, is requested from the room itself.
+        """
+        chunk = hierarchy.get(room_id)
+        if chunk is None:
+            # not visible in the hierarchy, e.g. no access or beyond the depth limit
+            return await self._fetch_room(room_id, preexec)
 
         if preexec is not None:
             await preexec(room_id)
 
-        state_events = await client.room_get_state(room_id)
+        widget = await self.state_service.get_state_event(
+            room_id,
+            HERALD_WIDGET_EVENT_TYPE,
+            HERALD_WIDGET_STATE_KEY
+        )
+        if isinstance(widget, RoomGetStateError):
+            # The room is listed but its state is not readable. Let the
+            # state backend report it, so both backends build the same node.
+            return await self._fetch_room(room_id)
+
+        events = self._state_events_from_hierarchy_chunk(chunk)
+        if widget is not None:
+            events.append(widget)
+        # power levels are fetched on demand by the promotion planner
+        return self._node_from_state_events(room_id, events, power_levels_included=False)
 
+    @staticmethod
+    def _state_events_from_hierarchy_chunk(chunk: dict) -> list[dict]:
+        """Translate a /hierarchy room chunk into the state events it summarizes."""
+        events: list[dict] = [{
+            "type": "m.room.create",
+            "state_key": "",
+            "content": {"type": chunk["room_type"]} if chunk.get("room_type") else {}
+        }, {
+            "type": "m.room.join_rules",
+            "state_key": "",
+            # the spec defines a missing join rule as public
+            "content": {"join_rule": chunk.get("join_rule", "public")}
+        }]
+        if chunk.get("name") is not None:
+            events.append({
+                "type": "m.room.name",
+                "state_key": "",
+                "content": {"name": chunk["name"]}
+            })
+        if chunk.get("canonical_alias") is not None:
+            events.append({
+                "type": "m.room.canonical_alias",
+                "state_key": "",
+                "content": {"canonical_alias": chunk["canonical_alias"]}
+            })
+        events.extend(chunk.get("children_state", []))
+        return events
+
+    def _node_from_state_events(
+        self,
+        room_id: str,
+        state_events: list[dict]|RoomGetStateError,
+        power_levels_included: bool = True
+    ) -> tuple[MatrixTreeNode, list[str]]:
+        """
+        power_levels_included tells whether a missing m.room.power_levels
+        event means the room has none, or just that it was not fetched.
+        """
         name = None
         canonical_alias = None
         is_space = False
-        childs = []
+        child_ids = []
         access = True
         error = None
         public = False
         herald_widget = None
         events = None
+        power_levels = None
 
         if isinstance(state_events, RoomGetStateError):
             access = False
             error = state_events
         else:
-            events = state_events.events
+            events = state_events
+            if power_levels_included:
+                power_levels = {}
             for ev in events:
                 t = ev["type"]
                 if t == "m.room.name":
@@ -76,29 +374,31 @@ class MatrixTreeBuilder:
                 elif t == "m.space.child":
                     if not 'via' in ev['content']:
                         continue # room was removed
-                    child_id = ev["state_key"]
-                    child_node = await self._fetch_tree_node(child_id, preexec)
-                    childs.append(child_node)
+                    child_ids.append(ev["state_key"])
                 elif t == "m.room.join_rules":
                     join_rule = ev.get("content", {}).get("join_rule")
                     public = join_rule == "public"
                 elif (
-                    t == "org.herald.tree_structure_request"
-                    and ev['state_key'] == 'herald_widget'
+                    t == HERALD_WIDGET_EVENT_TYPE
+                    and ev['state_key'] == HERALD_WIDGET_STATE_KEY
                 ):
                     herald_widget = ev['content']['widget_id']
+                elif t == "m.room.power_levels":
+                    power_levels = ev.get("content", {})
 
         type_ = MatrixNodeType.SPACE if is_space else MatrixNodeType.ROOM
 
-        return MatrixTreeNode(
+        node = MatrixTreeNode(
             room_id,
             name,
             canonical_alias,
             type_,
-            childs,
+            [],
             access,
             error,
             public,
             herald_widget,
-            events
+            events,
+            power_levels=power_levels
         )
+        return node, child_ids
@@ -1,23 +1,54 @@
+import asyncio
+import time
 from injector import inject, singleton
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.core.metrics.registry import MetricsRegistry
 from matrix_herald_bot.model.tree import MatrixTree
+from matrix_herald_bot.storage.tree_snapshots import TreeSnapshotStore
 
 @singleton
 class MatrixTreeCache:
     @inject
-    def __init__(self):
+    def __init__(
+        self,
+        snapshot_store: TreeSnapshotStore,
+        logger: MatrixLogger,
+        metrics: MetricsRegistry
+    ):
+        self.snapshot_store = snapshot_store
+        self.logger = logger
         self.trees: dict[str, MatrixTree] = {}
+        # when each tree was last set (for snapshots: when it was saved)
+        self.updated_at: dict[str, float] = {}
+        # latest snapshot version of each tree
+        self.versions: dict[str, int] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._trees_metric = metrics.gauge("herald_tree_cache_trees", "Cached room trees.")
+        self._rooms_metric = metrics.gauge(
+            "herald_tree_cache_rooms",
+            "Rooms in a cached room tree.",
+            ("space",)
+        )
+        self._age_metric = metrics.gauge(
+            "herald_tree_cache_age_seconds",
+            "Seconds since a cached room tree was last set.",
+            ("space",)
+        )
+        metrics.add_collector(self._collect_metrics)
 
     def __getitem__(self, room_id: str) -> MatrixTree:
         return self.trees[room_id]
 
     def __setitem__(self, room_id: str, tree: MatrixTree):
         self.trees[room_id] = tree
+        self.updated_at[room_id] = time.time()
 
     def __contains__(self, room_id: str) -> bool:
         return room_id in self.trees
 
     def __delitem__(self, room_id: str):
         del self.trees[room_id]
+        self.updated_at.pop(room_id, None)
 
     def __iter__(self):
         return iter(self.trees)
@@ -27,3 +58,56 @@ class MatrixTreeCache:
 
     def get(self, room_id: str, default=None) -> MatrixTree | None:
         return self.trees.get(room_id, default)
+
+    def touch(self, room_id: str):
+        """Mark the tree as current after it was changed in place."""
+        self.updated_at[room_id] = time.time()
+
+    def lock(self, room_id: str) -> asyncio.Lock:
+        """Lock to hold while reading and changing the tree across awaits."""
+        return self._locks.setdefault(room_id, asyncio.Lock())
+
+    def age(self, room_id: str) -> float | None:
+        """Seconds since the tree was set, None if it is not cached."""
+        updated_at = self.updated_at.get(room_id)
+        return None if updated_at is None else time.time() - updated_at
+
+    def _collect_metrics(self):
+        self._trees_metric.set(len(self.trees))
+        self._rooms_metric.clear()
+        self._age_metric.clear()
+        for room_id, tree in self.trees.items():
+            self._rooms_metric.set(len(tree), space=room_id)
+            self._age_metric.set(self.age(room_id) or 0.0, space=room_id)
+
+    async def save(self, room_id: str) -> int:
+        """Persist the current tree as a new snapshot version."""
+        version = await self.snapshot_store.save(
+            room_id,
+            self.trees[room_id].convert_to_snapshot_dict()
+        )
+        self.versions[room_id] = version
+        return version
+
+    async def load_snapshots(self) -> list[str]:
+        """Fill the cache from the latest snapshots and return the loaded room ids."""
+        loaded = []
+        for snapshot in await self.snapshot_store.load_latest():
+            try:
+                tree = MatrixTree.from_snapshot_dict(snapshot.data)
+            except (KeyError, TypeError, ValueError) as e:
+                self.logger.warning(
+                    f"Ignoring unreadable tree snapshot of {snapshot.room_id}: {e!r}"
+                )
+                continue
+            self.trees[snapshot.room_id] = tree
+            self.updated_at[snapshot.room_id] = snapshot.created_at
+            self.versions[snapshot.room_id] = snapshot.version
+            loaded.append(snapshot.room_id)
+
+        if loaded:
+            self.logger.info(
+                "Loaded tree snapshots.",
+                extra={"rooms": loaded, "versions": [self.versions[r] for r in loaded]}
+            )
+        return loaded
@@ -1,11 +1,25 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter
 from injector import inject, singleton
 from nio import RoomPutStateError, RoomPutStateResponse
+from matrix_herald_bot.config.model import Configuration
+from matrix_herald_bot.connection.scheduler import request_priority
 from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.model.enums import JobKind, JobStatus, RequestPriority
+from matrix_herald_bot.model.exceptions import JobFailedError
 from matrix_herald_bot.model.tree import MatrixTree
+from matrix_herald_bot.model.tree_node import MatrixTreeNode
 from matrix_herald_bot.services.admin_service import TuwunelAdminService
-from matrix_herald_bot.util.tree_iterator import MatrixTreeIterator
 from matrix_herald_bot.services.action_service import MatrixActionService
+from matrix_herald_bot.services.event_lag import MatrixEventLagTracker
+from matrix_herald_bot.services.job_queue import MatrixJobQueue, promote_job, widget_push_job
+from matrix_herald_bot.services.promotion_planner import MatrixPromotionPlanner
+from matrix_herald_bot.services.tree_cache import MatrixTreeCache
 from matrix_herald_bot.services.tree_builder import MatrixTreeBuilder
+from matrix_herald_bot.storage.widget_pushes import WidgetPushStore
 
 @singleton
 class MatrixTreeOperations:
@@ -15,44 +29,185 @@ class MatrixTreeOperations:
         admin_service: TuwunelAdminService,
         action_service: MatrixActionService,
         tree_builder: MatrixTreeBuilder,
-        logger: MatrixLogger
+        logger: MatrixLogger,
+        widget_pushes: WidgetPushStore,
+        promotion_planner: MatrixPromotionPlanner,
+        job_queue: MatrixJobQueue,
+        tree_cache: MatrixTreeCache,
+        config: Configuration,
+        lag_tracker: MatrixEventLagTracker
     ):
         self.admin_service = admin_service
         self.action_service = action_service
         self.tree_builder = tree_builder
         self.logger = logger
+        self.widget_pushes = widget_pushes
+        self.promotion_planner = promotion_planner
+        self.job_queue = job_queue
+        self.tree_cache = tree_cache
+        self.config = config
+        self.lag_tracker = lag_tracker
+        job_queue.register(JobKind.WIDGET_PUSH, self._run_widget_push_job)
+        # sent / skipped (unchanged) / superseded / failed widget pushes since start
+        self.widget_push_stats: Counter[str] = Counter()
+        # per widget room: newest requested push and a lock around the pushes
+        self._widget_push_generations: dict[str, int] = {}
+        self._widget_push_locks: dict[str, asyncio.Lock] = {}
 
     async def fetch_tree_and_join_on_all_public_nodes(self, room_id: str) -> MatrixTree:
-        return await self.tree_builder.fetch_tree(room_id, self.action_service.join_room)
+        tree = await self.tree_builder.fetch_tree(room_id, self.action_service.join_room_if_needed)
+        self.logger.debug("Join statistics.", extra=dict(self.action_service.join_stats))
+        return tree
 
     async def join_and_promote_users_on_all_public_nodes(
         self,
         room_id: str,
         users: list[str]
     ) -> MatrixTree:
-        tree = await self.tree_builder.fetch_tree(room_id, self.action_service.join_room)
+        """
+        Crawl the tree (joining every public room) and promote the users in
+        all public rooms.
+
+        The stages overlap: rooms are planned for promotion by a pool of
+        PROMOTION_WORKERS as soon as the crawl fetched them, and the planned
+        promotions are run by the job queue while the crawl continues.
+        """
+        rooms: asyncio.Queue[MatrixTreeNode|None] = asyncio.Queue()
+        batch = self.job_queue.new_batch()
+        planned: dict[str, MatrixTreeNode] = {}
+        promotions = [
+            asyncio.create_task(self._plan_streamed_promotions(rooms, users, batch, planned))
+            for _ in range(self.config.promotion_workers)
+        ]
+        try:
+            tree = await self.tree_builder.fetch_tree(
+                room_id,
+                self.action_service.join_room_if_needed,
+                rooms
+            )
+            commands = sum(await asyncio.gather(*promotions))
+        finally:
+            for task in promotions:
+                task.cancel()
 
-        for node in MatrixTreeIterator(tree.root):
-            if node.public:
-                print(node.name)
-                await self.admin_service.force_promote_users(users, node.id)
+        # durable, so an interrupted run resumes instead of starting over
+        results = await self.job_queue.wait_for_batch(batch)
+
+        # the planner worked on copies of the tree nodes
+        nodes = []
+        for node_id, planned_node in planned.items():
+            for node in tree.get_nodes(node_id):
+                if node.power_levels is None:
+                    node.power_levels = planned_node.power_levels
+            nodes.extend(tree.get_nodes(node_id))
+        done = [r for r in results if r.status == JobStatus.DONE]
+        self.promotion_planner.record_promotions(
+            nodes,
+            [(r.payload["user_id"], r.payload["room_id"]) for r in done]
+        )
+        self.logger.info(
+            "Promoted users on all public nodes.",
+            extra={
+                "rooms": len(planned),
+                "commands": commands,
+                "failed": len(results) - len(done),
+                "joins": dict(self.action_service.join_stats),
+            })
 
         return tree
 
+    async def _plan_streamed_promotions(
+        self,
+        rooms: asyncio.Queue[MatrixTreeNode|None],
+        users: list[str],
+        batch: str,
+        planned: dict[str, MatrixTreeNode]
+    ) -> int:
+        """Plan and queue the promotions of crawled rooms until the crawl ended."""
+        commands = 0
+        while (node := await rooms.get()) is not None:
+            if not node.public:
+                continue
+            planned[node.id] = node
+            pairs = await self.promotion_planner.plan(users, [node])
+            jobs = [promote_job(user_id, node_id) for user_id, node_id in pairs]
+            for job in jobs:
+                job.batch = batch
+            await self.job_queue.enqueue(jobs, requeue_done=True)
+            commands += len(jobs)
+        # let the other workers see the end of the crawl as well
+        rooms.put_nowait(None)
+        return commands
+
     async def send_tree_to_room(
         self,
         tree: MatrixTree,
         room_id: str,
-    ) -> RoomPutStateResponse|RoomPutStateError:
-        resp = await self.action_service.room_put_state(
-            room_id,
-            'org.herald.tree_structure',
-            tree.convert_to_dict() or {},
-            'herald_widget'
-        )
-        if isinstance(resp, RoomPutStateError):
-            self.logger.error(
-                f"Error sending tree structure to room {room_id}: {resp.message}"
-            )
+        force: bool = False
+    ) -> RoomPutStateResponse|RoomPutStateError|None:
+        """
+        Send the tree to the herald widget in the room.
+
+        Pushes to the same room run one at a time and the latest wins: a push
+        which got superseded by a newer one while waiting is dropped. A tree
+        identical to the one last delivered to the room is not sent again
+        unless forced. Both cases return None.
+        """
+        tree_read_at = time.time()
+        generation = self._widget_push_generations.get(room_id, 0) + 1
+        self._widget_push_generations[room_id] = generation
+
+        async with self._widget_push_locks.setdefault(room_id, asyncio.Lock()):
+            if self._widget_push_generations[room_id] != generation:
+                self.logger.debug(f"Dropping superseded tree push to room {room_id}.")
+                self.widget_push_stats["superseded"] += 1
+                return None
+
+            content = tree.convert_to_dict() or {}
+            content_hash = hashlib.sha256(
+                json.dumps(content, sort_keys=True, separators=(",", ":")).encode()
+            ).hexdigest()
+            if not force and await self.widget_pushes.get_hash(room_id) == content_hash:
+                self.logger.debug(f"Tree in room {room_id} is unchanged, skipping push.")
+                self.widget_push_stats["skipped"] += 1
+                self.lag_tracker.widget_pushed(room_id, tree_read_at)
+                return None
+
+            # widgets are what users look at, so pushes skip ahead of bulk work
+            with request_priority(RequestPriority.INTERACTIVE):
+                resp = await self.action_service.room_put_state(
+                    room_id,
+                    'org.herald.tree_structure',
+                    content,
+                    'herald_widget'
+                )
+
+            if isinstance(resp, RoomPutStateError):
+                self.widget_push_stats["failed"] += 1
+                self.logger.error(
+                    f"Error sending tree structure to room {room_id}: {resp.message}"
+                )
+            else:
+                self.widget_push_stats["sent"] += 1
+                await self.widget_pushes.set_hash(room_id, content_hash)
+                self.lag_tracker.widget_pushed(room_id, tree_read_at)
+
         return resp
 
+
+    async def queue_widget_pushes(self, tree: MatrixTree) -> int:
+        """Queue a push of the tree to every herald widget in it."""
+        return await self.job_queue.enqueue(
+            [widget_push_job(tree.root.id, widget.room_id) for widget in tree.herald_widgets],
+            requeue_done=True
+        )
+
+    async def _run_widget_push_job(self, payload: dict):
+        # the cached tree is read when the job runs, so a delayed push sends
+        # the latest tree
+        tree = self.tree_cache.get(payload["tree_root"])
+        if tree is None:
+            raise JobFailedError(f"Tree of {payload['tree_root']} is not cached.")
+        resp = await self.send_tree_to_room(tree, payload["room_id"])
+        if isinstance(resp, RoomPutStateError):
+            raise JobFailedError(resp.message, retryable=True)
@@ -29,6 +29,8 @@ class MatrixTreePrinter:
         print(f"{prefix}  access: {'True' if node.public else 'False'}")
         if node.herald_widget:
             print(f"{prefix}  herald_widget: {node.herald_widget}")
+        if node.cyclic_childs:
+            print(f"{prefix}  cyclic childs: {', '.join(node.cyclic_childs)}")
 
         if node.childs:
             print(f"{prefix}  childs:")
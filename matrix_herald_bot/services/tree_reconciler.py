@@ -0,0 +1,111 @@
+import asyncio
+from injector import inject, singleton
+from matrix_herald_bot.connection.scheduler import request_priority
+from matrix_herald_bot.core.event.bus import EventBus
+from matrix_herald_bot.core.event.events import TreeStructureUpdated
+from matrix_herald_bot.core.logging.loggers import MatrixLogger
+from matrix_herald_bot.model.enums import RequestPriority
+from matrix_herald_bot.model.tree import MatrixTree
+from matrix_herald_bot.services.tree_cache import MatrixTreeCache
+from matrix_herald_bot.services.tree_operations import MatrixTreeOperations
+
+@singleton
+class MatrixTreeReconciler:
+    """Brings a cached tree (e.g. loaded from a snapshot) in line with the server."""
+
+    @inject
+    def __init__(
+        self,
+        tree_cache: MatrixTreeCache,
+        tree_operations: MatrixTreeOperations,
+        event_bus: EventBus,
+        logger: MatrixLogger
+    ):
+        self.tree_cache = tree_cache
+        self.tree_operations = tree_operations
+        self.event_bus = event_bus
+        self.logger = logger
+        self._refreshes: dict[str, asyncio.Task[MatrixTree]] = {}
+
+    async def get_tree(self, room_id: str, max_age: float) -> MatrixTree:
+        """
+        Return the cached tree. A tree older than max_age is still returned
+        right away and refreshed in the background, only a tree which is not
+        cached at all is waited for.
+        """
+        tree = self.tree_cache.get(room_id)
+        if tree is None:
+            return await self.refresh(room_id)
+
+        age = self.tree_cache.age(room_id)
+        if age is not None and age > max_age and room_id not in self._refreshes:
+            self.logger.debug(f"Refreshing stale room tree {room_id} in the background.")
+            self._start_refresh(room_id).add_done_callback(self._log_failed_refresh)
+        return tree
+
+    async def refresh(self, room_id: str) -> MatrixTree:
+        """
+        Crawl the space and replace the cached tree. Callers arriving while a
+        refresh of the space is running share its result (single-flight).
+        """
+        if room_id in self._refreshes:
+            self.logger.debug(f"Joining running refresh of room tree {room_id}.")
+        # a cancelled caller must not cancel the crawl the others wait for
+        return await asyncio.shield(self._start_refresh(room_id))
+
+    def _start_refresh(self, room_id: str) -> asyncio.Task[MatrixTree]:
+        task = self._refreshes.get(room_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(room_id))
+            self._refreshes[room_id] = task
+            task.add_done_callback(lambda t: self._forget_refresh(room_id, t))
+        return task
+
+    def _log_failed_refresh(self, task: asyncio.Task[MatrixTree]):
+        if not task.cancelled() and (error := task.exception()) is not None:
+            self.logger.error(f"Background refresh of a room tree failed: {error!r}")
+
+    def _forget_refresh(self, room_id: str, task: asyncio.Task[MatrixTree]):
+        if self._refreshes.get(room_id) is task:
+            del self._refreshes[room_id]
+
+    async def _refresh(self, room_id: str) -> MatrixTree:
+        """
+        Crawl the space (joining its public rooms) and replace the cached tree.
+
+        TreeStructureUpdated is only published if the tree is new or differs
+        from the cached one. Rooms which were not in the cached tree are
+        marked for user promotion.
+        """
+        # the crawl may have been started by an interactive request, but must
+        # not compete with interactive traffic
+        with request_priority(RequestPriority.TREE_MAINTENANCE):
+            tree = await self.tree_operations.fetch_tree_and_join_on_all_public_nodes(room_id)
+
+        # the cached tree is compared and replaced only after changes made to
+        # it during the crawl (e.g. rooms added by the sync loop) are done
+        async with self.tree_cache.lock(room_id):
+            old_tree = self.tree_cache.get(room_id)
+            changed = True
+            if old_tree is not None:
+                changed = (
+                    old_tree.root.convert_to_snapshot_dict()
+                    != tree.root.convert_to_snapshot_dict()
+                )
+                pending = old_tree.childs_which_need_user_promotion
+                tree.childs_which_need_user_promotion = pending + [
+                    child_id for child_id in tree.child_ids
+                    if child_id not in old_tree and child_id not in pending
+                ]
+
+            self.tree_cache[room_id] = tree
+            if not changed:
+                await self.tree_cache.save(room_id)
+
+        if changed:
+            self.logger.info(f"Room tree of {room_id} refreshed with changes.")
+            await self.event_bus.publish(TreeStructureUpdated(tree), wait=False)
+        else:
+            self.logger.info(f"Room tree of {room_id} is up to date.")
+
+        return tree
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from collections.abc import Callable
+from typing import Any
+from injector import inject, singleton
+from matrix_herald_bot.config.model import Configuration
+
+DATABASE_FILENAME = "herald.sqlite3"
+
+@singleton
+class HeraldDatabase:
+    """
+    Local SQLite database for state that has to survive restarts.
+
+    sqlite3 blocks, so every access runs in a worker thread. A single
+    connection is shared and serialized with a lock.
+    """
+
+    @inject
+    def __init__(self, config: Configuration):
+        self.path = os.path.join(config.data_dir, DATABASE_FILENAME)
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._schemas: set[str] = set()
+
+    async def run[R](self, fn: Callable[[sqlite3.Connection], R]) -> R:
+        """Run fn with the connection inside a transaction in a worker thread."""
+        return await asyncio.to_thread(self._run, fn)
+
+    async def execute(self, sql: str, params: tuple | dict = ()) -> None:
+        await self.run(lambda c: c.execute(sql, params))
+
+    async def fetchone(self, sql: str, params: tuple | dict = ()) -> tuple | None:
+        return await self.run(lambda c: c.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: tuple | dict = ()) -> list[tuple]:
+        return await self.run(lambda c: c.execute(sql, params).fetchall())
+
+    async def ensure_schema(self, name: str, script: str):
+        """Create the tables of a store once per process."""
+        if name in self._schemas:
+            return
+        await self.run(lambda c: c.executescript(script))
+        self._schemas.add(name)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                return fn(connection)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        return self._connection
@@ -0,0 +1,65 @@
+from dataclasses import astuple, dataclass
+from injector import inject, singleton
+from matrix_herald_bot.storage.database import HeraldDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inaccessible_rooms (
+    room_id TEXT PRIMARY KEY,
+    error_class TEXT NOT NULL,
+    message TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    first_failed_at REAL NOT NULL,
+    last_failed_at REAL NOT NULL,
+    retry_at REAL NOT NULL
+);
+"""
+
+@dataclass
+class InaccessibleRoom:
+    room_id: str
+    # status code of the error, the message for errors without one
+    error_class: str
+    message: str
+    # consecutive failures with this error class
+    failures: int
+    first_failed_at: float
+    last_failed_at: float
+    # crawls reuse the error until then
+    retry_at: float
+
+@singleton
+class InaccessibleRoomStore:
+    """Rooms whose state could not be read, with the time of their next retry."""
+
+    @inject
+    def __init__(self, database: HeraldDatabase):
+        self.database = database
+
+    async def load(self) -> list[InaccessibleRoom]:
+        await self.database.ensure_schema("inaccessible_rooms", SCHEMA)
+        rows = await self.database.fetchall(
+            "SELECT room_id, error_class, message, failures, first_failed_at, "
+            "last_failed_at, retry_at FROM inaccessible_rooms ORDER BY room_id"
+        )
+        return [InaccessibleRoom(*row) for row in rows]
+
+    async def save(self, room: InaccessibleRoom):
+        await self.database.ensure_schema("inaccessible_rooms", SCHEMA)
+        await self.database.execute(
+            "INSERT OR REPLACE INTO inaccessible_rooms (room_id, error_class, message, "
+            "failures, first_failed_at, last_failed_at, retry_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            astuple(room)
+        )
+
+    async def delete(self, room_ids: list[str] | None = None):
+        """Delete the given rooms, all rooms without room_ids."""
+        await self.database.ensure_schema("inaccessible_rooms", SCHEMA)
+        if room_ids is None:
+            await self.database.execute("DELETE FROM inaccessible_rooms")
+            return
+
+        await self.database.run(lambda c: c.executemany(
+            "DELETE FROM inaccessible_rooms WHERE room_id = ?",
+            [(room_id,) for room_id in room_ids]
+        ))
@@ -0,0 +1,187 @@
+import json
+import time
+from dataclasses import dataclass, field
+from injector import inject, singleton
+from matrix_herald_bot.model.enums import JobKind, JobStatus
+from matrix_herald_bot.storage.database import HeraldDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    batch TEXT,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority, created_at);
+CREATE INDEX IF NOT EXISTS jobs_by_batch ON jobs (batch, status);
+"""
+
+# lower runs first: widget pushes are what users wait for, promotions are bulk
+JOB_PRIORITIES = {
+    JobKind.WIDGET_PUSH: 0,
+    JobKind.PROMOTE: 1,
+}
+
+@dataclass
+class Job:
+    # identifies the work, enqueueing the same key again does not duplicate it
+    key: str
+    kind: JobKind
+    payload: dict = field(default_factory=dict)
+    batch: str | None = None
+    attempts: int = 0
+
+@dataclass
+class JobResult:
+    key: str
+    kind: JobKind
+    payload: dict
+    status: JobStatus
+    error: str | None
+
+@singleton
+class JobStore:
+    """
+    Durable job queue. Every state change is committed right away, so after
+    a crash only the jobs which were running have to be run again.
+    """
+
+    @inject
+    def __init__(self, database: HeraldDatabase):
+        self.database = database
+
+    async def enqueue(self, jobs: list[Job], requeue_done: bool = False) -> int:
+        """
+        Add the jobs and return how many were (re)queued.
+
+        A pending job with the same key gets the new payload. Finished jobs
+        are only queued again with requeue_done, otherwise work which was
+        already done is not repeated. A running job keeps counting its
+        attempts, which tells its current run apart from the one before.
+        """
+        await self.database.ensure_schema("jobs", SCHEMA)
+        now = time.time()
+        finished = (JobStatus.DONE.value, JobStatus.FAILED.value)
+        requeue = finished if requeue_done else (JobStatus.FAILED.value,)
+        rows = [
+            (
+                job.key,
+                job.kind.value,
+                json.dumps(job.payload, separators=(",", ":")),
+                job.batch,
+                JOB_PRIORITIES[job.kind],
+                JobStatus.PENDING.value,
+                now,
+                now,
+            )
+            for job in jobs
+        ]
+
+        def enqueue(connection) -> int:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT INTO jobs (key, kind, payload, batch, priority, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "payload = excluded.payload, batch = excluded.batch, "
+                "status = excluded.status, updated_at = excluded.updated_at, "
+                "attempts = CASE WHEN jobs.status IN ('pending', 'running') "
+                "THEN jobs.attempts ELSE 0 END, "
+                "error = NULL "
+                f"WHERE jobs.status IN ('pending', 'running', {', '.join('?' * len(requeue))})",
+                [row + requeue for row in rows]
+            )
+            return connection.total_changes - before
+
+        return await self.database.run(enqueue)
+
+    async def claim(self, limit: int) -> list[Job]:
+        """Mark up to limit pending jobs as running and return them."""
+        await self.database.ensure_schema("jobs", SCHEMA)
+        now = time.time()
+
+        def claim(connection) -> list[Job]:
+            rows = connection.execute(
+                "SELECT key, kind, payload, batch, attempts FROM jobs WHERE status = ? "
+                "ORDER BY priority, created_at LIMIT ?",
+                (JobStatus.PENDING.value, limit)
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE key = ?",
+                [(JobStatus.RUNNING.value, now, row[0]) for row in rows]
+            )
+            return [
+                Job(key, JobKind(kind), json.loads(payload), batch, attempts + 1)
+                for key, kind, payload, batch, attempts in rows
+            ]
+
+        return await self.database.run(claim)
+
+    async def finish(self, job: Job, status: JobStatus, error: str | None = None):
+        """
+        Record the outcome of a running job. A job which was enqueued again
+        while running stays pending and runs once more, and the outcome of a
+        run which was claimed again since is dropped.
+        """
+        await self.database.execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+            "WHERE key = ? AND status = ? AND attempts = ?",
+            (status.value, error, time.time(), job.key, JobStatus.RUNNING.value, job.attempts)
+        )
+
+    async def requeue_running(self) -> int:
+        """Queue the jobs again which were running when the process stopped."""
+        await self.database.ensure_schema("jobs", SCHEMA)
+
+        def requeue(connection) -> int:
+            return connection.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?",
+                (JobStatus.PENDING.value, time.time(), JobStatus.RUNNING.value)
+            ).rowcount
+
+        return await self.database.run(requeue)
+
+    async def purge_finished(self, older_than_s: float) -> int:
+        await self.database.ensure_schema("jobs", SCHEMA)
+
+        def purge(connection) -> int:
+            return connection.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (JobStatus.DONE.value, JobStatus.FAILED.value, time.time() - older_than_s)
+            ).rowcount
+
+        return await self.database.run(purge)
+
+    async def counts(self, batch: str | None = None) -> dict[JobStatus, int]:
+        await self.database.ensure_schema("jobs", SCHEMA)
+        if batch is None:
+            rows = await self.database.fetchall(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            )
+        else:
+            rows = await self.database.fetchall(
+                "SELECT status, COUNT(*) FROM jobs WHERE batch = ? GROUP BY status",
+                (batch,)
+            )
+        counts = {status: 0 for status in JobStatus}
+        counts.update({JobStatus(status): count for status, count in rows})
+        return counts
+
+    async def results(self, batch: str) -> list[JobResult]:
+        await self.database.ensure_schema("jobs", SCHEMA)
+        rows = await self.database.fetchall(
+            "SELECT key, kind, payload, status, error FROM jobs WHERE batch = ? "
+            "ORDER BY created_at, key",
+            (batch,)
+        )
+        return [
+            JobResult(key, JobKind(kind), json.loads(payload), JobStatus(status), error)
+            for key, kind, payload, status, error in rows
+        ]
@@ -0,0 +1,59 @@
+import hashlib
+import json
+from injector import inject, singleton
+from matrix_herald_bot.storage.database import HeraldDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+NEXT_BATCH_KEY = "next_batch"
+
+@singleton
+class SyncStateStore:
+    """Sync token and uploaded filter ids, so a restart can resume the sync."""
+
+    @inject
+    def __init__(self, database: HeraldDatabase):
+        self.database = database
+        self._next_batch: str | None = None
+
+    async def get_next_batch(self) -> str | None:
+        self._next_batch = await self._get(NEXT_BATCH_KEY)
+        return self._next_batch
+
+    async def set_next_batch(self, next_batch: str):
+        if next_batch == self._next_batch:
+            return
+        await self._set(NEXT_BATCH_KEY, next_batch)
+        self._next_batch = next_batch
+
+    async def get_filter_id(self, user_id: str, definition: dict) -> str | None:
+        return await self._get(self._filter_key(user_id, definition))
+
+    async def set_filter_id(self, user_id: str, definition: dict, filter_id: str):
+        await self._set(self._filter_key(user_id, definition), filter_id)
+
+    @staticmethod
+    def _filter_key(user_id: str, definition: dict) -> str:
+        # a changed definition gets a new key and is therefore uploaded again
+        digest = hashlib.sha256(
+            json.dumps([user_id, definition], sort_keys=True).encode()
+        ).hexdigest()
+        return f"filter:{digest}"
+
+    async def _get(self, key: str) -> str | None:
+        await self.database.ensure_schema("sync_state", SCHEMA)
+        row = await self.database.fetchone("SELECT value FROM sync_state WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    async def _set(self, key: str, value: str):
+        await self.database.ensure_schema("sync_state", SCHEMA)
+        await self.database.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
@@ -0,0 +1,77 @@
+import json
+import time
+from dataclasses import dataclass
+from injector import inject, singleton
+from matrix_herald_bot.storage.database import HeraldDatabase
+
+# bump when the snapshot layout changes, older snapshots are ignored then
+SNAPSHOT_FORMAT = 1
+# snapshots kept per tree, older versions are pruned on save
+SNAPSHOT_HISTORY = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tree_snapshots (
+    room_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    format INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (room_id, version)
+);
+"""
+
+@dataclass
+class TreeSnapshot:
+    room_id: str
+    version: int
+    created_at: float
+    data: dict
+
+@singleton
+class TreeSnapshotStore:
+    """Versioned tree snapshots, one history per watched space."""
+
+    @inject
+    def __init__(self, database: HeraldDatabase):
+        self.database = database
+
+    async def save(self, room_id: str, data: dict) -> int:
+        """Store a new snapshot and return its version."""
+        await self.database.ensure_schema("tree_snapshots", SCHEMA)
+        payload = json.dumps(data, separators=(",", ":"))
+        created_at = time.time()
+
+        def save(connection) -> int:
+            row = connection.execute(
+                "SELECT COALESCE(MAX(version), 0) FROM tree_snapshots WHERE room_id = ?",
+                (room_id,)
+            ).fetchone()
+            version = row[0] + 1
+            connection.execute(
+                "INSERT INTO tree_snapshots (room_id, version, format, created_at, data) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (room_id, version, SNAPSHOT_FORMAT, created_at, payload)
+            )
+            connection.execute(
+                "DELETE FROM tree_snapshots WHERE room_id = ? AND version <= ?",
+                (room_id, version - SNAPSHOT_HISTORY)
+            )
+            return version
+
+        return await self.database.run(save)
+
+    async def load_latest(self) -> list[TreeSnapshot]:
+        """Return the newest readable snapshot of every stored tree."""
+        await self.database.ensure_schema("tree_snapshots", SCHEMA)
+        rows = await self.database.fetchall(
+            "SELECT room_id, version, created_at, data FROM tree_snapshots AS s "
+            "WHERE format = ? AND version = ("
+            "    SELECT MAX(version) FROM tree_snapshots "
+            "    WHERE room_id = s.room_id AND format = ?"
+            ")",
+            (SNAPSHOT_FORMAT, SNAPSHOT_FORMAT)
+        )
+        return [
+            TreeSnapshot(room_id, version, created_at, json.loads(data))
+            for room_id, version, created_at, data in rows
+        ]
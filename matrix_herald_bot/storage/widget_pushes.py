@@ -0,0 +1,40 @@
+import time
+from injector import inject, singleton
+from matrix_herald_bot.storage.database import HeraldDatabase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS widget_pushes (
+    room_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    pushed_at REAL NOT NULL
+);
+"""
+
+@singleton
+class WidgetPushStore:
+    """Content hash of the last tree delivered to each widget room."""
+
+    @inject
+    def __init__(self, database: HeraldDatabase):
+        self.database = database
+        self._hashes: dict[str, str] | None = None
+
+    async def get_hash(self, room_id: str) -> str | None:
+        return (await self._load()).get(room_id)
+
+    async def set_hash(self, room_id: str, content_hash: str):
+        hashes = await self._load()
+        await self.database.execute(
+            "INSERT INTO widget_pushes (room_id, content_hash, pushed_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(room_id) DO UPDATE SET "
+            "content_hash = excluded.content_hash, pushed_at = excluded.pushed_at",
+            (room_id, content_hash, time.time())
+        )
+        hashes[room_id] = content_hash
+
+    async def _load(self) -> dict[str, str]:
+        if self._hashes is None:
+            await self.database.ensure_schema("widget_pushes", SCHEMA)
+            rows = await self.database.fetchall("SELECT room_id, content_hash FROM widget_pushes")
+            self._hashes = dict(rows)
+        return self._hashes